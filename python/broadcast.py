@@ -0,0 +1,191 @@
+import asyncio
+import time
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.request import HTTPXRequest
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError
+
+from limiter import TokenBucket
+from media import Media
+from snapshot import SaveSnapshot, LoadSnapshot, RemoveSnapshot
+from settings import BroadcastRate, BroadcastConcurrency, BroadcastRetries, BroadcastPoolSize
+from log import Log
+
+class BroadcastReport():
+    def __init__(self, total: int) -> None:
+        self.total   = total
+        self.sent    = 0
+        self.failed  = 0
+        self.blocked = 0
+        self.retried = 0
+        self.blocked_uids = []
+        self.start    = time.monotonic()
+        self.duration = 0.0
+
+    def finish(self):
+        self.duration = time.monotonic() - self.start
+
+    def __str__(self) -> str:
+        return (
+            f"sent {self.sent}, failed {self.failed}, blocked {self.blocked} "
+            f"of {self.total} with {self.retried} retries in {self.duration:.2f}s"
+        )
+
+class BroadcastCheckpoint():
+    SAVE_EVERY = 50
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.delivered = LoadSnapshot(name) or {}
+        self.marked = 0
+        self.save_task = None
+
+    def resumed(self) -> bool:
+        return len(self.delivered) > 0
+
+    def pending(self, stage: str, uids: list[str|int]) -> list[str|int]:
+        delivered = self.delivered.setdefault(stage, set())
+        return [uid for uid in uids if str(uid) not in delivered]
+
+    def mark(self, stage: str, uid: str|int):
+        self.delivered[stage].add(str(uid))
+        self.marked += 1
+        if self.marked % self.SAVE_EVERY == 0 and (self.save_task is None or self.save_task.done()):
+            self.save_task = asyncio.create_task(self.save())
+
+    async def save(self):
+        payload = {stage: set(uids) for stage,uids in self.delivered.items()}
+        try:
+            await asyncio.to_thread(SaveSnapshot, self.name, payload)
+        except Exception:
+            Log.error(f"Was not able to save broadcast checkpoint {self.name}", exc_info=True)
+
+    async def flush(self):
+        if self.save_task is not None:
+            await self.save_task
+        await self.save()
+
+    async def remove(self):
+        if self.save_task is not None:
+            await self.save_task
+        await asyncio.to_thread(RemoveSnapshot, self.name)
+
+class BroadcastEngineClass():
+    SENT    = 'sent'
+    FAILED  = 'failed'
+    BLOCKED = 'blocked'
+
+    PRIVATE_CHAT_INTERVAL = 1
+    GROUP_CHAT_INTERVAL   = 3
+
+    POOL_TIMEOUT = 30
+
+    def __init__(self) -> None:
+        self.bucket = TokenBucket('telegram-broadcast', BroadcastRate, BroadcastRate)
+        self.concurrency = BroadcastConcurrency
+        self.retries     = BroadcastRetries
+        self.chat_last   = {}
+        self.bot = None
+
+    async def start(self, token: str):
+        self.bot = Bot(token, request=HTTPXRequest(
+            connection_pool_size=BroadcastPoolSize,
+            pool_timeout=self.POOL_TIMEOUT
+        ))
+        await self.bot.initialize()
+        Log.info(f"Started broadcast bot with {BroadcastPoolSize} connections pool")
+
+    async def stop(self):
+        if self.bot is not None:
+            await self.bot.shutdown()
+            self.bot = None
+
+    async def send(self, bot: Bot, uids: list[str|int], message: str, parse_mode: str,
+        send_photo: str = None, reply_markup: InlineKeyboardMarkup = None,
+        checkpoint: BroadcastCheckpoint = None, stage: str = None
+    ) -> BroadcastReport:
+        if checkpoint is not None:
+            skipped = len(uids)
+            uids = checkpoint.pending(stage, uids)
+            skipped -= len(uids)
+            if skipped > 0:
+                Log.info(f"Resuming broadcast {checkpoint.name} {stage}, skipped {skipped} delivered ids")
+        if self.bot is not None:
+            bot = self.bot
+        report = BroadcastReport(len(uids))
+        queue  = asyncio.Queue()
+        for uid in uids:
+            queue.put_nowait(uid)
+
+        async def worker():
+            while not queue.empty():
+                uid = queue.get_nowait()
+                result = await self._send_one(bot, uid, message, parse_mode, send_photo, reply_markup, report)
+                setattr(report, result, getattr(report, result) + 1)
+                if result == self.BLOCKED:
+                    report.blocked_uids.append(uid)
+                if checkpoint is not None:
+                    checkpoint.mark(stage, uid)
+
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, len(uids)))])
+        report.finish()
+        if checkpoint is not None:
+            await checkpoint.flush()
+        self._prune_chat_last()
+        Log.info(f"Done broadcast: {report}")
+        return report
+
+    async def _send_one(self, bot: Bot, uid: str|int, message: str, parse_mode: str,
+        send_photo: str, reply_markup: InlineKeyboardMarkup, report: BroadcastReport
+    ) -> str:
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                report.retried += 1
+            await self._wait_chat(uid)
+            await self.bucket.acquire()
+            try:
+                if send_photo == None or send_photo == '':
+                    await bot.send_message(chat_id=uid, text=message, parse_mode=parse_mode, reply_markup=reply_markup)
+                else:
+                    await Media.send_photo(
+                        lambda photo: bot.send_photo(chat_id=uid, photo=photo, caption=message, parse_mode=parse_mode, reply_markup=reply_markup),
+                        send_photo
+                    )
+                return self.SENT
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                Log.info(f"Flood control while sending to id {uid}, retry in {retry_after}s")
+                self.bucket.pause(retry_after)
+            except Forbidden:
+                Log.info(f"Bot is blocked by id {uid}")
+                return self.BLOCKED
+            except BadRequest as e:
+                if 'chat not found' in e.message.lower():
+                    Log.info(f"Chat with id {uid} was not found")
+                    return self.BLOCKED
+                Log.info(f"Bad request while sending to id {uid}: {e.message}")
+                return self.FAILED
+            except NetworkError as e:
+                Log.info(f"Network error while sending to id {uid}: {e.message}, attempt {attempt+1}")
+                await asyncio.sleep(2 ** attempt)
+            except Exception:
+                Log.info(f"Error while sending to id {uid}", exc_info=True)
+                return self.FAILED
+        return self.FAILED
+
+    async def _wait_chat(self, uid: str|int):
+        interval = self.GROUP_CHAT_INTERVAL if str(uid).startswith('-') else self.PRIVATE_CHAT_INTERVAL
+        now  = time.monotonic()
+        last = self.chat_last.get(str(uid))
+        self.chat_last[str(uid)] = max(now, last + interval) if last is not None else now
+        if last is not None and now - last < interval:
+            await asyncio.sleep(last + interval - now)
+
+    def _prune_chat_last(self):
+        now = time.monotonic()
+        self.chat_last = {
+            uid: last for uid,last in self.chat_last.items()
+            if now - last < self.GROUP_CHAT_INTERVAL
+        }
+
+Broadcast = BroadcastEngineClass()
@@ -1,2 +1,5 @@
 class BotShouldBeInactive(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class SheetNotRevalidated(Exception):
+    pass
@@ -0,0 +1,66 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from log import Log
+
+class TokenBucket():
+    def __init__(self, name: str, rate: float, capacity: float) -> None:
+        self.name     = name
+        self.rate     = rate
+        self.capacity = capacity
+
+        self.tokens  = capacity
+        self.updated = time.monotonic()
+        self.waiters = []
+        self.counter = itertools.count()
+        self.pump_task = None
+
+        self.acquired = 0
+        self.waited   = 0.0
+
+    async def acquire(self, priority: int = 0):
+        self._refill()
+        if len(self.waiters) == 0 and self.tokens >= 1:
+            self.tokens -= 1
+            self.acquired += 1
+            return
+        start  = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        if self.pump_task is None or self.pump_task.done():
+            self.pump_task = asyncio.create_task(self._pump())
+        await future
+        self.acquired += 1
+        self.waited   += time.monotonic() - start
+
+    def pause(self, seconds: float):
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+        Log.info(f"Paused {self.name} bucket for {seconds:.2f}s")
+
+    def metrics(self) -> dict:
+        return {
+            'tokens':   self.tokens,
+            'waiting':  len(self.waiters),
+            'acquired': self.acquired,
+            'waited':   self.waited,
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def _pump(self):
+        while len(self.waiters) > 0:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(True)
@@ -10,7 +10,7 @@ from telegram.ext import (
     CallbackQueryHandler,
 )
 
-from settings import BotToken
+from settings import BotToken, InteractivePoolSize
 
 from log import Log, INFO, DEBUG
 if len(sys.argv) > 1 and sys.argv[1] in ['debug', '--debug', '-D']:
@@ -21,7 +21,6 @@ else:
     Debug = False
 
 from sheets import (
-    I18n,
     LogSheet,
     Switch,
     Settings,
@@ -31,10 +30,13 @@ from sheets import (
     Report,
     Keyboard,
     Notifications,
+    WarmStart,
     PerfomNotification
 )
 
 from basic_handlers import ErrorHandlerFun, ChatMemberHandlerFun
+from scheduler import Scheduler
+from broadcast import Broadcast
 
 UPDATE_GROUP_USER_REQUEST  = 0
 UPDATE_GROUP_GROUP_REQUEST = 2
@@ -43,43 +45,39 @@ UPDATE_GROUP_CHAT_MEMBER   = 3
 START_COMMAND  = 'start'
 HELP_COMMAND   = 'help'
 REPORT_COMMAND = 'report'
+REFRESH_COMMAND = 'refresh'
 
 async def post_init(app: Application) -> None:
-    await I18n.async_init()
-    await LogSheet.async_init()
-    await Switch.async_init()
-    await Settings.async_init()
-    await Groups.async_init()
-    await Users.async_init()
-    await Registration.async_init()
-    await Report.async_init()
-    await Keyboard.async_init()
-    await Notifications.async_init()
+    await WarmStart(app)
+    await Broadcast.start(BotToken)
 
     bot: Bot = app.bot
     await bot.set_my_commands([(HELP_COMMAND, Settings.help_command_description)])
 
     await LogSheet.write(None, "Started an application")
 
-    app.create_task(Switch.update(app))
-    app.create_task(Settings.update(app))
-    app.create_task(Groups.update(app))
-    app.create_task(Users.update(app))
-    app.create_task(Registration.update(app))
-    app.create_task(Report.update(app))
-    app.create_task(Keyboard.update(app))
-    app.create_task(Notifications.update(app))
+    for adapter in [Switch, Settings, Groups, Users, Registration, Report, Keyboard, Notifications]:
+        Scheduler.add_job(adapter.name, adapter.update, lambda adapter=adapter: adapter.update_sleep_time, refresh=True)
 
-    app.create_task(PerfomNotification(app))
+    if Users.write_behind:
+        Scheduler.add_job('users-write-behind', Users.flush, lambda: Users.write_behind_flush_time, jitter=0)
+
+    Scheduler.add_job('log-sheet-flush', LogSheet.flush, lambda: LogSheet.flush_time, jitter=0)
+    Scheduler.add_job(Notifications.TIMER_JOB, lambda: PerfomNotification(app), Notifications.next_due_in, jitter=0)
+    Scheduler.start(app)
 
 async def post_shutdown(app: Application) -> None:
+    await Broadcast.stop()
+    await Users.flush()
     await LogSheet.write(None, "Stopped an application")
+    await LogSheet.flush()
 
 if __name__ == '__main__':
     Log.info("Starting...")
     app = ApplicationBuilder() \
         .token(BotToken) \
         .concurrent_updates(True) \
+        .connection_pool_size(InteractivePoolSize) \
         .post_init(post_init) \
         .post_shutdown(post_shutdown) \
         .build()
@@ -107,6 +105,11 @@ if __name__ == '__main__':
         group=UPDATE_GROUP_GROUP_REQUEST
     )
 
+    app.add_handler(
+        CommandHandler(REFRESH_COMMAND, Groups.refresh_handler, filters=Groups.IsAdminFilter, block=False),
+        group=UPDATE_GROUP_GROUP_REQUEST
+    )
+
     ##
     # User handlers
     ##
@@ -0,0 +1,80 @@
+import asyncio
+from typing import Callable, Coroutine
+
+from telegram import Bot, Message
+from telegram.error import BadRequest
+
+from snapshot import SaveSnapshot, LoadSnapshot
+from log import Log
+
+class MediaCacheClass():
+    SNAPSHOT_NAME = 'media-cache'
+
+    def __init__(self) -> None:
+        self.file_ids = None
+        self.locks    = {}
+
+        self.hits    = 0
+        self.uploads = 0
+
+    async def send_photo(self, send: Callable[[str], Coroutine], url: str) -> Message:
+        self._load()
+        file_id = self.file_ids.get(url)
+        if file_id is not None:
+            try:
+                message = await send(file_id)
+                self.hits += 1
+                return message
+            except BadRequest as e:
+                if 'file' not in e.message.lower():
+                    raise e
+                Log.info(f"Dropped cached file id for picture {url}: {e.message}")
+                self._drop(url, file_id)
+
+        lock = self.locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            file_id = self.file_ids.get(url)
+            if file_id is not None:
+                self.hits += 1
+                return await send(file_id)
+            message = await send(url)
+            self.uploads += 1
+            if message is not None and len(message.photo) > 0:
+                self.file_ids[url] = message.photo[-1].file_id
+                Log.info(f"Cached file id for picture {url}")
+                await self._save()
+            return message
+
+    async def preload(self, bot: Bot, chat_id: str|int, url: str):
+        self._load()
+        if url in self.file_ids:
+            return
+        await self.send_photo(
+            lambda photo: bot.send_photo(chat_id=chat_id, photo=photo, disable_notification=True),
+            url
+        )
+
+    def metrics(self) -> dict:
+        return {
+            'cached':  len(self.file_ids or {}),
+            'hits':    self.hits,
+            'uploads': self.uploads,
+        }
+
+    def _load(self):
+        if self.file_ids is not None:
+            return
+        self.file_ids = LoadSnapshot(self.SNAPSHOT_NAME) or {}
+        Log.info(f"Loaded {len(self.file_ids)} cached picture file ids")
+
+    def _drop(self, url: str, file_id: str):
+        if self.file_ids.get(url) == file_id:
+            del self.file_ids[url]
+
+    async def _save(self):
+        try:
+            await asyncio.to_thread(SaveSnapshot, self.SNAPSHOT_NAME, dict(self.file_ids))
+        except Exception:
+            Log.error("Was not able to save picture file ids", exc_info=True)
+
+Media = MediaCacheClass()
@@ -0,0 +1,144 @@
+import asyncio
+import random
+from collections import deque
+from datetime import datetime
+from typing import Callable, Coroutine
+
+from telegram.ext import Application
+
+from settings import RefreshConcurrency
+from log import Log
+
+class SchedulerJob():
+    def __init__(self, name: str, callback: Callable[[], Coroutine], interval: Callable[[], float], jitter: float, refresh: bool) -> None:
+        self.name     = name
+        self.callback = callback
+        self.interval = interval
+        self.jitter   = jitter
+        self.refresh  = refresh
+
+        self.wakeup = asyncio.Event()
+        self.rescheduled = False
+        self.running = False
+        self.runs = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+class SchedulerClass():
+    LAG_PROBE_INTERVAL = 0.1
+    LAG_WINDOW         = 600
+    LAG_WARNING        = 1.0
+
+    def __init__(self) -> None:
+        self.jobs = {}
+        self.refresh_semaphore = asyncio.Semaphore(RefreshConcurrency)
+        self.app = None
+
+        self.lags    = deque(maxlen=self.LAG_WINDOW)
+        self.lag_max = 0.0
+
+    def add_job(self, name: str, callback: Callable[[], Coroutine], interval: Callable[[], float], jitter: float = 0.1, refresh: bool = False):
+        self.jobs[name] = SchedulerJob(name, callback, interval, jitter, refresh)
+        if self.app is not None:
+            self.app.create_task(self._loop(self.jobs[name]))
+
+    def start(self, app: Application):
+        self.app = app
+        for job in self.jobs.values():
+            app.create_task(self._loop(job))
+        app.create_task(self._probe_lag())
+        Log.info(f"Started scheduler with jobs {list(self.jobs.keys())}")
+
+    def run_now(self, name: str = None) -> list[str]:
+        jobs = [
+            job for job in self.jobs.values()
+            if (name is None and job.refresh) or job.name == name
+        ]
+        for job in jobs:
+            job.wakeup.set()
+        return [job.name for job in jobs]
+
+    def reschedule(self, name: str):
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        job.rescheduled = True
+        job.wakeup.set()
+
+    def report(self) -> str:
+        lines = []
+        for job in self.jobs.values():
+            if job.last_run is None:
+                lines.append(f"{job.name}: `never run`")
+                continue
+            lines.append(
+                f"{job.name}: `{job.last_run.strftime('%Y-%m-%d %H:%M:%S')}` "
+                f"took `{job.last_duration:.2f}s`"
+                f"{' *failed*' if job.last_error is not None else ''}"
+                f"{' *running*' if job.running else ''}"
+            )
+        if len(self.lags) > 0:
+            lines.append(
+                f"event loop lag: `{self.lags[-1] * 1000:.1f}ms` now, "
+                f"`{max(self.lags) * 1000:.1f}ms` max in last `{len(self.lags) * self.LAG_PROBE_INTERVAL:.0f}s`, "
+                f"`{self.lag_max * 1000:.1f}ms` max overall"
+            )
+        return "\n".join(lines)
+
+    async def _probe_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.LAG_PROBE_INTERVAL)
+            lag = max(loop.time() - start - self.LAG_PROBE_INTERVAL, 0.0)
+            self.lags.append(lag)
+            self.lag_max = max(self.lag_max, lag)
+            if lag >= self.LAG_WARNING:
+                Log.info(f"Event loop was blocked for {lag:.2f}s")
+
+    async def _loop(self, job: SchedulerJob):
+        delay = random.uniform(0, job.interval()) if job.jitter > 0 else job.interval()
+        while True:
+            if await self._sleep(job, delay):
+                await self._run(job)
+            delay = job.interval() * (1 + random.uniform(-job.jitter, job.jitter))
+
+    async def _sleep(self, job: SchedulerJob, delay: float) -> bool:
+        try:
+            await asyncio.wait_for(job.wakeup.wait(), max(delay, 0))
+            if job.rescheduled:
+                Log.debug(f"Rescheduled job {job.name}")
+            else:
+                Log.info(f"Woke up job {job.name} on demand")
+        except asyncio.TimeoutError:
+            pass
+        job.wakeup.clear()
+        rescheduled, job.rescheduled = job.rescheduled, False
+        return not rescheduled
+
+    async def _run(self, job: SchedulerJob):
+        if job.refresh:
+            async with self.refresh_semaphore:
+                await self._call(job)
+        else:
+            await self._call(job)
+
+    async def _call(self, job: SchedulerJob):
+        start = datetime.now()
+        job.running = True
+        try:
+            await job.callback()
+            job.last_error = None
+        except Exception as error:
+            job.last_error = error
+            Log.error(f"Error in scheduled job {job.name}")
+            await self.app.process_error(None, error)
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_run = start
+            job.last_duration = (datetime.now() - start).total_seconds()
+            Log.debug(f"Done job {job.name} in {job.last_duration:.2f}s")
+
+Scheduler = SchedulerClass()
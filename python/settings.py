@@ -15,4 +15,29 @@ else:
 
 SheetsLink = environ.get('SHEETS_LINK')
 SwitchUpdateTime = int(environ.get('SWITCH_UPDATE_TIME'))
-SettingsUpdateTime = int(environ.get('SETTINGS_UPDATE_TIME'))
\ No newline at end of file
+SettingsUpdateTime = int(environ.get('SETTINGS_UPDATE_TIME'))
+
+SnapshotDir = environ.get('SNAPSHOT_DIR') or 'snapshots'
+RefreshConcurrency = int(environ.get('REFRESH_CONCURRENCY') or 2)
+
+SheetsReadQuota = int(environ.get('SHEETS_READ_QUOTA') or 60)
+SheetsWriteQuota = int(environ.get('SHEETS_WRITE_QUOTA') or 60)
+SheetsRetries = int(environ.get('SHEETS_RETRIES') or 5)
+
+LogQueueSize = int(environ.get('LOG_QUEUE_SIZE') or 1000)
+LogFlushTime = int(environ.get('LOG_FLUSH_TIME') or 5)
+
+BroadcastRate = int(environ.get('BROADCAST_RATE') or 25)
+BroadcastConcurrency = int(environ.get('BROADCAST_CONCURRENCY') or 8)
+BroadcastRetries = int(environ.get('BROADCAST_RETRIES') or 3)
+BroadcastPoolSize = int(environ.get('BROADCAST_POOL_SIZE') or 8)
+InteractivePoolSize = int(environ.get('INTERACTIVE_POOL_SIZE') or 256)
+
+NotificationWarmupTime = int(environ.get('NOTIFICATION_WARMUP_TIME') or 5)
+MediaCacheChatId = environ.get('MEDIA_CACHE_CHAT_ID')
+
+WriteBehind = environ.get('WRITE_BEHIND', '').lower() in ['1', 'true', 'yes']
+WriteBehindFlushTime = int(environ.get('WRITE_BEHIND_FLUSH_TIME') or 500)
+WriteBehindMaxCells = int(environ.get('WRITE_BEHIND_MAX_CELLS') or 500)
+
+CompactStorage = environ.get('COMPACT_STORAGE', '').lower() in ['1', 'true', 'yes']
\ No newline at end of file
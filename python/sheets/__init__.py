@@ -7,32 +7,128 @@ from sheets.groups import Groups
 from sheets.users import Users
 from sheets.report import Report
 from sheets.keyboard import Keyboard
-from sheets.notifications import Notifications
+from sheets.notifications import Notifications, PreparedNotification
+
+from sheets.connection import Connection, Limiter
 
 import asyncio
+from gspread import utils
+import pandas as pd
 from telegram.ext import Application
 from telegram.constants import ParseMode
 
+from broadcast import Broadcast, BroadcastCheckpoint
+from media import Media
+from settings import MediaCacheChatId
 from log import Log
 
+BOOTSTRAP_ADAPTERS = [LogSheet, Switch, Settings, Groups, Users, Registration, Report, Keyboard, Notifications]
+
+BOOTSTRAP_RETRY_TIME = 5
+BOOTSTRAP_RETRY_MAX  = 300
+
+async def Bootstrap():
+    Log.info("Start bootstrap")
+    await I18n.async_init()
+    for adapter in BOOTSTRAP_ADAPTERS:
+        adapter._resolve_sheet_name()
+    
+    sh = await Connection.spreadsheet()
+    response = await Limiter.read(Limiter.BACKGROUND, sh.values_batch_get, [adapter.bootstrap_range() for adapter in BOOTSTRAP_ADAPTERS])
+    for adapter,value_range in zip(BOOTSTRAP_ADAPTERS, response['valueRanges']):
+        await adapter.async_init(utils.fill_gaps(value_range.get('values', [])))
+    Log.info("Done bootstrap")
+
+async def WarmStart(app: Application):
+    Log.info("Start warm start from snapshots")
+    for adapter in [I18n] + BOOTSTRAP_ADAPTERS:
+        if not await adapter.restore_snapshot():
+            Log.info("Snapshots are incomplete, falling back to bootstrap")
+            await Bootstrap()
+            return
+    Log.info("Done warm start from snapshots, revalidating in background")
+    app.create_task(BackgroundBootstrap())
+
+async def BackgroundBootstrap():
+    delay = BOOTSTRAP_RETRY_TIME
+    while True:
+        try:
+            await Bootstrap()
+            return
+        except Exception:
+            Log.error(f"Background bootstrap failed, retrying in {delay}s", exc_info=True)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, BOOTSTRAP_RETRY_MAX)
+
 async def PerfomNotification(app: Application):
     Log.info("Start performing notification")
-    for idx,row in Notifications.as_df.loc[Notifications.selector_to_notify()].iterrows():
-        await Users.send_notification_to_all_users(
-            app.bot, row.text_markdown, ParseMode.MARKDOWN, row.send_picture, row.state, row.condition
-        )
-        if row.state == "":
-            await Groups.send_to_all_normal_groups(app.bot, row.text_markdown, ParseMode.MARKDOWN, row.send_picture)
-        admin_group_text = \
-            Settings.notification_admin_groups_template.format(message=row.text_markdown) if row.condition == None \
-            else Settings.notification_admin_groups_condition_template.format(message=row.text_markdown, condition=row.condition)
-        await Groups.send_to_all_admin_groups(
-            app.bot, 
-            admin_group_text,
-            ParseMode.MARKDOWN,
-            row.send_picture
-        )
-        await Notifications.set_done(idx)
+    for idx in Notifications.pop_warmup():
+        if idx in Notifications.running or idx not in Notifications.as_df.index:
+            continue
+        try:
+            Notifications.prepared[idx] = await PrepareNotification(app, idx, Notifications.as_df.loc[idx], preload=True)
+        except Exception:
+            Log.error(f"Was not able to prepare notification {idx} in advance", exc_info=True)
+    error = None
+    for idx in Notifications.pop_due():
+        if idx in Notifications.running or idx not in Notifications.as_df.index:
+            continue
+        row = Notifications.as_df.loc[idx]
+        if row.is_active not in [I18n.yes, I18n.in_progress]:
+            continue
+        Notifications.running.add(idx)
+        try:
+            await PerfomSingleNotification(app, idx, row)
+        except Exception as e:
+            Log.error(f"Was not able to perform notification {idx}, will retry later", exc_info=True)
+            Notifications.retry_later(idx)
+            error = error or e
+        finally:
+            Notifications.running.discard(idx)
     Log.info("Done performing notification")
-    await asyncio.sleep(Settings.notifications_update_time)
-    app.create_task(PerfomNotification(app))
\ No newline at end of file
+    if error is not None:
+        raise error
+
+async def PrepareNotification(app: Application, idx: int, row: pd.Series, preload: bool = False) -> PreparedNotification:
+    admin_group_text = \
+        Settings.notification_admin_groups_template.format(message=row.text_markdown) if row.condition == None \
+        else Settings.notification_admin_groups_condition_template.format(message=row.text_markdown, condition=row.condition)
+    stages = [('users', Users.notification_uids(row.condition), row.text_markdown, Notifications.get_keyboard(row.state))]
+    if row.state == "":
+        stages.append(('groups', Groups.normal_uids(), row.text_markdown, None))
+    stages.append(('admin_groups', Groups.admin_uids(), admin_group_text, None))
+    if preload and MediaCacheChatId is not None and row.send_picture != '':
+        await Media.preload(app.bot, MediaCacheChatId, row.send_picture)
+    Log.info(f"Prepared notification {idx} for {sum(len(uids) for _,uids,_,_ in stages)} ids")
+    return PreparedNotification(Notifications.checkpoint_name(idx), row.send_picture, stages)
+
+async def PerfomSingleNotification(app: Application, idx: int, row: pd.Series):
+    name = Notifications.checkpoint_name(idx)
+    prepared = Notifications.prepared.pop(idx, None)
+    if prepared is not None and prepared.name != name:
+        prepared = None
+    catch_up = prepared is not None
+    if prepared is None:
+        prepared = await PrepareNotification(app, idx, row)
+
+    checkpoint = BroadcastCheckpoint(name)
+    if checkpoint.resumed():
+        Log.info(f"Resuming notification {idx} from checkpoint")
+    if row.is_active != I18n.in_progress:
+        await Notifications.set_in_progress(idx)
+    
+    await SendPreparedNotification(app, idx, prepared, checkpoint)
+    if catch_up:
+        await SendPreparedNotification(app, idx, await PrepareNotification(app, idx, row), checkpoint)
+    await Notifications.set_done(idx)
+    await checkpoint.remove()
+
+async def SendPreparedNotification(app: Application, idx: int, prepared: PreparedNotification, checkpoint: BroadcastCheckpoint):
+    for stage, uids, text, reply_markup in prepared.stages:
+        report = await Broadcast.send(
+            app.bot, uids, text, ParseMode.MARKDOWN, prepared.send_picture, reply_markup, checkpoint, stage
+        )
+        if report.total > 0:
+            Log.info(f"Notification {idx} {stage}: {report}")
+        if stage == 'users':
+            await Users.banned_by_broadcast(report)
@@ -0,0 +1,131 @@
+import asyncio
+import random
+import gspread_asyncio
+from gspread.exceptions import APIError
+from requests import RequestException
+
+from google.oauth2.service_account import Credentials 
+
+from settings import SheetsSecret, SheetsLink, SheetsReadQuota, SheetsWriteQuota, SheetsRetries
+
+from limiter import TokenBucket
+from log import Log
+
+def get_creds():
+    creds = Credentials.from_service_account_info(SheetsSecret)
+    scoped = creds.with_scopes([
+        "https://spreadsheets.google.com/feeds",
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive",
+    ])
+    return scoped
+
+class SheetsClientManager(gspread_asyncio.AsyncioGspreadClientManager):
+    async def handle_gspread_error(self, e, method, args, kwargs):
+        raise e
+    
+    async def handle_requests_error(self, e, method, args, kwargs):
+        raise e
+
+agcm = SheetsClientManager(get_creds, gspread_delay=0)
+
+class SheetsLimiterClass():
+    INTERACTIVE = 0
+    BACKGROUND  = 1
+    LOG         = 2
+
+    RETRY_TIME  = 1
+    BACKOFF_MAX = 64
+
+    def __init__(self) -> None:
+        self.read_bucket  = TokenBucket('sheets-read',  SheetsReadQuota / 60,  max(1, SheetsReadQuota // 6))
+        self.write_bucket = TokenBucket('sheets-write', SheetsWriteQuota / 60, max(1, SheetsWriteQuota // 6))
+        self.throttled = 0
+    
+    async def read(self, priority: int, method, *args, **kwargs):
+        return await self._call(self.read_bucket, priority, method, *args, **kwargs)
+    
+    async def write(self, priority: int, method, *args, **kwargs):
+        return await self._call(self.write_bucket, priority, method, *args, **kwargs)
+    
+    def metrics(self) -> dict:
+        return {
+            'read':      self.read_bucket.metrics(),
+            'write':     self.write_bucket.metrics(),
+            'throttled': self.throttled,
+        }
+    
+    async def _call(self, bucket: TokenBucket, priority: int, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            await bucket.acquire(priority)
+            try:
+                return await method(*args, **kwargs)
+            except APIError as e:
+                code = e.response.status_code
+                if (400 <= code <= 499 and code != 429) or attempt >= SheetsRetries:
+                    raise
+                backoff = self._backoff(attempt)
+                attempt += 1
+                if code == 429:
+                    self.throttled += 1
+                    Log.info(f"Sheets quota exceeded calling {method.__name__}, retry {attempt} in {backoff:.2f}s")
+                    bucket.pause(backoff)
+                    continue
+                Log.error(f"Error {code} while calling {method.__name__}, retry {attempt} in {backoff:.2f}s")
+                await asyncio.sleep(backoff)
+            except RequestException:
+                if attempt >= SheetsRetries:
+                    raise
+                backoff = self._backoff(attempt)
+                attempt += 1
+                Log.error(f"Network error while calling {method.__name__}, retry {attempt} in {backoff:.2f}s")
+                await asyncio.sleep(backoff)
+    
+    def _backoff(self, attempt: int) -> float:
+        return min(self.BACKOFF_MAX, self.RETRY_TIME * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+Limiter = SheetsLimiterClass()
+
+class SheetsConnectionClass():
+    def __init__(self) -> None:
+        self.agc = None
+        self.sh  = None
+        self.worksheets = {}
+        self.lock = asyncio.Lock()
+
+        self.token = lambda: self.agc.gc.auth.token
+    
+    async def spreadsheet(self) -> gspread_asyncio.AsyncioGspreadSpreadsheet:
+        async with self.lock:
+            return await self._spreadsheet()
+    
+    async def worksheet(self, sheet_name: str) -> gspread_asyncio.AsyncioGspreadWorksheet:
+        async with self.lock:
+            sh = await self._spreadsheet()
+            if sheet_name not in self.worksheets:
+                for wks in await Limiter.read(Limiter.BACKGROUND, sh.worksheets):
+                    self.worksheets[wks.title] = wks
+                Log.debug(f"Resolved worksheets {list(self.worksheets.keys())}")
+            if sheet_name not in self.worksheets:
+                self.worksheets[sheet_name] = await Limiter.read(Limiter.BACKGROUND, sh.worksheet, sheet_name)
+            return self.worksheets[sheet_name]
+    
+    def invalidate(self, sheet_name: str = None):
+        if sheet_name is None:
+            self.sh = None
+            self.worksheets = {}
+        else:
+            self.worksheets.pop(sheet_name, None)
+        Log.info(f"Invalidated connection to {sheet_name if sheet_name is not None else 'spreadsheet'}")
+    
+    async def _spreadsheet(self) -> gspread_asyncio.AsyncioGspreadSpreadsheet:
+        agc = await agcm.authorize()
+        if agc is not self.agc or self.sh is None:
+            self.agc = agc
+            self.sh  = await Limiter.read(Limiter.BACKGROUND, agc.open_by_url, SheetsLink)
+            self.worksheets = {}
+            Log.info("(Re) Connected to spreadsheet")
+        return self.sh
+
+Connection = SheetsConnectionClass()
@@ -3,29 +3,42 @@ from sheets.sheet import AbstractSheetAdapter
 
 from telegram import Message, Update, Chat, Bot
 from telegram.ext import ContextTypes
-from telegram.constants import ParseMode
 
 from sheets.i18n import I18n
 from sheets.settings import Settings
 from sheets.report import Report
 
+from scheduler import Scheduler
+from broadcast import BroadcastReport, BroadcastCheckpoint
+
 class GroupsAdapterClass(AbstractSheetAdapter):
     def __init__(self) -> None:
         super().__init__('groups', 'groups', initialize_as_df=True)
+        self.columns   = ['chat_id', 'is_admin', 'is_active']
+        self.skip_rows = 1
         self.GroupChatFilter    = self.GroupChatClass(outer_obj=self)
         self.IsRegisteredFilter = self.GroupChatFilter & self.IsRegisteredClass(outer_obj=self)
         self.IsAdminFilter      = self.GroupChatFilter & self.IsAdminClass(outer_obj=self)
 
         self.uid_col = 'chat_id'
+
+        self.get = lambda uid: self._get_by_uid(uid)
+
+        self.selector_normal     = lambda: self.as_df.is_admin == I18n.no
+        self.selector_admin      = lambda: self.as_df.is_admin.isin(I18n.yes_super)
+        self.selector_superadmin = lambda: self.as_df.is_admin == I18n.super
+        self.normal_uids = lambda: self._get_uids(self.selector_normal())
+        self.admin_uids  = lambda: self._get_uids(self.selector_admin())
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.groups
+    
+    async def _pre_async_init(self):
         self.update_sleep_time = Settings.groups_update_time
         self.retry_sleep_time  = self.update_sleep_time // 2
     
-    async def _get_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(await self.wks.get_all_records())
-        df = df.drop(index = 0, axis = 0)
+    def _build_df(self, values: list[list[str]]) -> pd.DataFrame:
+        df = self._df_from_values(values)
         df = df.loc[
             (df.chat_id != "") &
             (df.is_admin.isin(I18n.yes_no_super)) &
@@ -34,22 +47,20 @@ class GroupsAdapterClass(AbstractSheetAdapter):
         df.chat_id = df.chat_id.apply(str)
         return df
     
-    async def send_to_all_normal_groups(self, bot: Bot, message: str, parse_mode: str, send_photo: str = None):
-        await self._send_to_all_uids(
-            self.as_df.is_admin == I18n.no,
-            bot, message, parse_mode, send_photo
-        )
-    
-    async def send_to_all_admin_groups(self, bot: Bot, message: str, parse_mode: str, send_photo: str = None):
-        await self._send_to_all_uids(
-            self.as_df.is_admin.isin(I18n.yes_super),
-            bot, message, parse_mode, send_photo
+    async def send_to_all_admin_groups(self, bot: Bot, message: str, parse_mode: str, send_photo: str = None,
+                                       checkpoint: BroadcastCheckpoint = None) -> BroadcastReport:
+        return await self._send_to_all_uids(
+            self.selector_admin(),
+            bot, message, parse_mode, send_photo,
+            checkpoint=checkpoint, stage='admin_groups'
         )
     
-    async def send_to_all_superadmin_groups(self, bot: Bot, message: str, parse_mode: str, send_photo: str = None):
-        await self._send_to_all_uids(
-            self.as_df.is_admin == I18n.super,
-            bot, message, parse_mode, send_photo
+    async def send_to_all_superadmin_groups(self, bot: Bot, message: str, parse_mode: str, send_photo: str = None,
+                                            checkpoint: BroadcastCheckpoint = None) -> BroadcastReport:
+        return await self._send_to_all_uids(
+            self.selector_superadmin(),
+            bot, message, parse_mode, send_photo,
+            checkpoint=checkpoint, stage='superadmin_groups'
         )
     
     class GroupChatClass(AbstractSheetAdapter.AbstractFilter):
@@ -62,18 +73,27 @@ class GroupsAdapterClass(AbstractSheetAdapter):
     
     class IsAdminClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
-            df = self.outer_obj.as_df
-            return not df.loc[
-                self.outer_obj.selector(message.chat_id) &
-                (df.is_admin.isin(I18n.yes_super))
-            ].empty
+            group = self.outer_obj.get(message.chat_id)
+            return group is not None and group.is_admin in I18n.yes_super
     
     async def help_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        group = self.as_df.loc[self.selector(update.effective_chat.id)].iloc[0]
+        group = self.get(update.effective_chat.id)
         reply = Settings.help_admin_group if group.is_admin else Settings.help_normal_group
         await update.message.reply_markdown(reply)
     
     async def report_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        await update.message.reply_markdown(Report.markdown)
+        await update.message.reply_markdown(Report.get_markdown())
+    
+    async def refresh_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        job_name = context.args[0] if len(context.args) > 0 else None
+        triggered = Scheduler.run_now(job_name)
+        sizes = {adapter.name: adapter.memory_usage() for adapter in AbstractSheetAdapter.adapters}
+        await update.message.reply_markdown(
+            f"Triggered: `{', '.join(triggered) if len(triggered) > 0 else '-'}`\n\n{Scheduler.report()}\n\n" +
+            "\n".join(
+                f"{name}: `{size / 1024:.1f} KiB`"
+                for name,size in sizes.items() if size > 0
+            )
+        )
 
 Groups = GroupsAdapterClass()
@@ -1,18 +1,22 @@
-import pandas as pd
 from sheets.sheet import AbstractSheetAdapter
 
 class I18nAdapterClass(AbstractSheetAdapter):
+    DEFAULTS = {
+        'in_progress': 'в процессе',
+    }
+
     def __init__(self) -> None:
         super().__init__('i18n', 'i18n', initialize_as_df=True)
     
-    async def _get_df(self) -> pd.DataFrame:
-        return pd.DataFrame(await self.wks.get_all_records())
-    
     async def _post_async_init(self) -> None:
         for _,row in self.as_df.iterrows():
             setattr(self, row.key, row.value)
+        for key,value in self.DEFAULTS.items():
+            if not hasattr(self, key):
+                setattr(self, key, value)
         self.yes_no = [self.yes, self.no]
         self.yes_no_done = [self.yes, self.no, self.done]
+        self.yes_no_done_in_progress = [self.yes, self.no, self.done, self.in_progress]
         self.yes_no_super = [self.yes, self.no, self.super]
         self.yes_super = [self.yes, self.super]
 
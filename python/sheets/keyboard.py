@@ -9,16 +9,19 @@ from sheets.settings import Settings
 class KeyboardAdapterClass(AbstractSheetAdapter):
     def __init__(self) -> None:
         super().__init__('keyboard', 'keyboard', initialize_as_df=True)
+        self.columns   = ['key', 'is_active', 'function', 'text_markdown', 'send_picture']
+        self.skip_rows = 1
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.keyboard
+    
+    async def _pre_async_init(self):
         self.REGISTER_FUNCTION = I18n.register
         self.update_sleep_time = Settings.keyboard_update_time
         self.retry_sleep_time  = self.update_sleep_time // 2
     
-    async def _get_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(await self.wks.get_all_records())
-        df = df.drop(index = 0, axis = 0)
+    def _build_df(self, values: list[list[str]]) -> pd.DataFrame:
+        df = self._df_from_values(values)
         df = df.loc[
             (df.key != "") &
             (df.is_active == I18n.yes)
@@ -0,0 +1,119 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+
+from log import Log
+
+class SheetLock():
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+        self.readers = 0
+        self.writer  = False
+        self.waiters = deque()
+        self.keys    = {}
+
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max   = 0.0
+
+    @asynccontextmanager
+    async def shared(self, key: str|int = None):
+        start = asyncio.get_running_loop().time()
+        await self._acquire(False)
+        try:
+            key_lock = self._get_key_lock(key) if key is not None else nullcontext()
+            try:
+                async with key_lock:
+                    self._account(start, f"shared {key}")
+                    yield
+            finally:
+                if key is not None:
+                    self._put_key_lock(key)
+        finally:
+            self._release(False)
+
+    @asynccontextmanager
+    async def exclusive(self):
+        start = asyncio.get_running_loop().time()
+        await self._acquire(True)
+        try:
+            self._account(start, "exclusive")
+            yield
+        finally:
+            self._release(True)
+
+    def metrics(self) -> dict:
+        return {
+            'waiting':    len(self.waiters),
+            'readers':    self.readers,
+            'writer':     self.writer,
+            'wait_count': self.wait_count,
+            'wait_avg':   self.wait_total / self.wait_count if self.wait_count > 0 else 0.0,
+            'wait_max':   self.wait_max,
+        }
+
+    async def _acquire(self, exclusive: bool):
+        if not self.writer and len(self.waiters) == 0 and (not exclusive or self.readers == 0):
+            self._grant(exclusive)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((exclusive, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                try:
+                    self.waiters.remove((exclusive, future))
+                except ValueError:
+                    pass
+                self._wake()
+            else:
+                self._release(exclusive)
+            raise
+
+    def _grant(self, exclusive: bool):
+        if exclusive:
+            self.writer = True
+        else:
+            self.readers += 1
+
+    def _release(self, exclusive: bool):
+        if exclusive:
+            self.writer = False
+        else:
+            self.readers -= 1
+        self._wake()
+
+    def _wake(self):
+        while len(self.waiters) > 0:
+            exclusive, future = self.waiters[0]
+            if future.done():
+                self.waiters.popleft()
+                continue
+            if self.writer or (exclusive and self.readers > 0):
+                return
+            self.waiters.popleft()
+            self._grant(exclusive)
+            future.set_result(True)
+            if exclusive:
+                return
+
+    def _get_key_lock(self, key: str|int) -> asyncio.Lock:
+        entry = self.keys.setdefault(str(key), [asyncio.Lock(), 0])
+        entry[1] += 1
+        return entry[0]
+
+    def _put_key_lock(self, key: str|int):
+        entry = self.keys[str(key)]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.keys[str(key)]
+
+    def _account(self, start: float, what: str):
+        waited = asyncio.get_running_loop().time() - start
+        self.wait_count += 1
+        self.wait_total += waited
+        self.wait_max    = max(self.wait_max, waited)
+        if waited > 0:
+            Log.debug(f"Waited {waited:.3f}s for {what} lock at {self.name}")
@@ -1,31 +1,81 @@
 from sheets.sheet import AbstractSheetAdapter
+from sheets.connection import Limiter
+from gspread import utils
 from datetime import datetime
+from collections import deque
 
 from sheets.i18n import I18n
 
+from settings import LogQueueSize, LogFlushTime
 from log import Log
 
 class LogSheetAdapterClass(AbstractSheetAdapter):
     def __init__(self) -> None:
         super().__init__('logs', 'log-sheet')
+        self.snapshot_attrs  = ['timestamp_col', 'chat_id_col', 'message_col']
+        self.bootstrap_range = lambda: utils.absolute_range_name(self.sheet_name, '1:1')
+
+        self.queue = deque()
+        self.queue_size = LogQueueSize
+        self.flush_time = LogFlushTime
+        self.written = 0
+        self.dropped = 0
+        self.failed  = 0
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.logs
     
     async def _post_async_init(self):
-        self.timestamp_col = await self._find_col_by_data('timestamp')
-        self.chat_id_col = await self._find_col_by_data('chat_id')
-        self.message_col = await self._find_col_by_data('message')
+        header = (await self._get_values())[0]
+        self.timestamp_col = header.index('timestamp') + 1
+        self.chat_id_col = header.index('chat_id') + 1
+        self.message_col = header.index('message') + 1
+    
+    async def _get_values(self) -> list[list[str]]:
+        if self.prefetched_values is None:
+            return [await Limiter.read(Limiter.BACKGROUND, self.wks.row_values, 1)]
+        return await super()._get_values()
+    
+    async def _post_restore(self):
+        pass
     
     async def write(self, chat_id: int|str, message: str):
-        row = await self._next_available_row()
+        if len(self.queue) >= self.queue_size:
+            self.dropped += 1
+            Log.warning(f"Dropped {self.name} log entry chat_id: {chat_id} message: {message}, {self.dropped} dropped so far")
+            return
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        update = self._prepare_batch_update([
-            (row, self.timestamp_col, timestamp),
-            (row, self.chat_id_col, chat_id),
-            (row, self.message_col, message),
-        ])
-        await self.wks.batch_update(update)
-        Log.info(f"Wrote to {self.name} log database chat_id: {chat_id} message: {message}")
+        self.queue.append((timestamp, chat_id, message))
+        Log.info(f"Queued to {self.name} log database chat_id: {chat_id} message: {message}")
+    
+    async def flush(self):
+        async with self.flush_lock:
+            if len(self.queue) == 0:
+                return
+            entries = list(self.queue)
+            self.queue.clear()
+            
+            width = max(self.timestamp_col, self.chat_id_col, self.message_col)
+            rows = []
+            for timestamp, chat_id, message in entries:
+                row = [''] * width
+                row[self.timestamp_col-1] = timestamp
+                row[self.chat_id_col-1]   = chat_id
+                row[self.message_col-1]   = message
+                rows.append(row)
+            
+            try:
+                await self._connect()
+                await Limiter.write(Limiter.LOG, self.wks.append_rows, rows)
+            except Exception:
+                self.failed += 1
+                self.queue.extendleft(reversed(entries))
+                while len(self.queue) > self.queue_size:
+                    self.queue.pop()
+                    self.dropped += 1
+                Log.error(f"Error while flushing {len(entries)} entries to {self.name} log database, kept them queued", exc_info=True)
+                return
+            self.written += len(entries)
+            Log.info(f"Wrote {len(entries)} entries to {self.name} log database, {self.written} written and {self.dropped} dropped so far")
 
 LogSheet = LogSheetAdapterClass()
\ No newline at end of file
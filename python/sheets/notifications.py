@@ -1,11 +1,23 @@
 from telegram import InlineKeyboardMarkup,InlineKeyboardButton
+import asyncio
 import pandas as pd
 from sheets.sheet import AbstractSheetAdapter
 
 from sheets.i18n import I18n
 from sheets.settings import Settings
 
-from datetime import datetime
+from scheduler import Scheduler
+from settings import NotificationWarmupTime
+
+from datetime import datetime, timedelta
+import hashlib
+import heapq
+from typing import NamedTuple
+
+class PreparedNotification(NamedTuple):
+    name: str
+    send_picture: str
+    stages: list[tuple[str, list[str], str, InlineKeyboardMarkup|None]]
 
 class NotificationsAdapterClass(AbstractSheetAdapter):
     CALLBACK_SET_STATE_PREFIX   = 'user_notification_set_state_'
@@ -17,31 +29,44 @@ class NotificationsAdapterClass(AbstractSheetAdapter):
     CALLBACK_ANSWER_PATTERN   = 'user_notification_answer_*'
     CALLBACK_ANSWER_SEPARATOR = '_'
 
+    TIMER_JOB = 'perform-notification'
+
+    DIGEST_COLUMNS = ['scheldue_date', 'text_markdown', 'state', 'button_text', 'send_picture', 'condition']
+
     def __init__(self) -> None:
         super().__init__('notifications', 'notifications', initialize_as_df=True)
+        self.skip_rows = 1
 
-        self.selector_to_notify = lambda: (
-            (self.as_df.is_active == I18n.yes) &
-            (self.as_df.scheldue_date <= datetime.now())
-        )
         self.wks_row_pad = 2
-        self.selector = lambda idx: self.as_df.index == idx
+        self.uid_values = lambda df: df.index
+
+        self.states   = frozenset()
+        self.running  = set()
+        self.pending  = []
+        self.warmup   = []
+        self.prepared = {}
+        self.warmup_time = timedelta(minutes=NotificationWarmupTime)
+        self.checkpoint_name = lambda idx: "notification-{idx}-{digest}".format(
+            idx = idx,
+            digest = hashlib.md5(self.as_df.loc[idx][self.DIGEST_COLUMNS].to_string().encode()).hexdigest()[:8]
+        )
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.notifications
+    
+    async def _pre_async_init(self):
         self.update_sleep_time = Settings.notifications_update_time
         self.retry_sleep_time  = self.update_sleep_time // 2
     
-    async def _get_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(await self.wks.get_all_records())
-        df = df.drop(index = 0, axis = 0)
+    def _build_df(self, values: list[list[str]]) -> pd.DataFrame:
+        df = self._df_from_values(values)
 
         df.button_text   = df.button_text.apply(lambda x: x.split('\n'))
         df.button_answer = df.button_answer.apply(lambda x: x.split('\n'))
         
         df = df.loc[
             (df.scheldue_date != "") &
-            (df.is_active.isin(I18n.yes_no_done)) &
+            (df.is_active.isin(I18n.yes_no_done_in_progress)) &
             (df.text_markdown != "") &
             (
                 (
@@ -60,7 +85,50 @@ class NotificationsAdapterClass(AbstractSheetAdapter):
         return df
     
     async def _process_df_update(self):
-        self.states = self.as_df.state.values
+        self.states, self.pending, self.warmup = await asyncio.to_thread(self._build_schedule, self.as_df)
+        self.prepared = {
+            idx: prepared for idx,prepared in self.prepared.items()
+            if idx in self.as_df.index and prepared.name == self.checkpoint_name(idx)
+        }
+        Scheduler.reschedule(self.TIMER_JOB)
+    
+    def _build_schedule(self, df: pd.DataFrame) -> tuple[frozenset, list, list]:
+        states = frozenset(df.loc[df.state != ''].state.values)
+        scheldue_dates = pd.to_datetime(df.loc[df.is_active.isin([I18n.yes, I18n.in_progress])].scheldue_date)
+        pending = list(zip(scheldue_dates.dt.to_pydatetime(), scheldue_dates.index))
+        warmup = [
+            (scheldue_date - self.warmup_time, idx)
+            for scheldue_date,idx in pending
+        ]
+        heapq.heapify(pending)
+        heapq.heapify(warmup)
+        return states, pending, warmup
+    
+    def next_due_in(self) -> float:
+        heads = [heap[0][0] for heap in [self.pending, self.warmup] if len(heap) > 0]
+        if len(heads) == 0:
+            return self.update_sleep_time
+        return max((min(heads) - datetime.now()).total_seconds(), 0)
+    
+    def pop_due(self) -> list[int]:
+        return self._pop_until_now(self.pending)
+    
+    def pop_warmup(self) -> list[int]:
+        return self._pop_until_now(self.warmup)
+    
+    def _pop_until_now(self, heap: list[tuple[datetime,int]]) -> list[int]:
+        due = []
+        now = datetime.now()
+        while len(heap) > 0 and heap[0][0] <= now:
+            _, idx = heapq.heappop(heap)
+            due.append(idx)
+        return due
+    
+    def retry_later(self, idx: int):
+        heapq.heappush(self.pending, (datetime.now() + timedelta(seconds=self.retry_sleep_time), idx))
+    
+    async def set_in_progress(self, idx: int|str):
+        await self._update_record(idx, 'is_active', I18n.in_progress)
     
     async def set_done(self, idx: int|str):
         await self._update_record(idx, 'is_active', I18n.done)
@@ -1,4 +1,5 @@
 import pandas as pd
+from typing import NamedTuple
 from sheets.sheet import AbstractSheetAdapter
 
 from telegram import ReplyKeyboardRemove, ReplyKeyboardMarkup
@@ -6,18 +7,31 @@ from telegram import ReplyKeyboardRemove, ReplyKeyboardMarkup
 from sheets.i18n import I18n
 from sheets.settings import Settings
 
+class RegistrationState(NamedTuple):
+    state: str
+    question: str
+    is_main: bool
+    next_state: str|None
+    reply_keyboard: ReplyKeyboardMarkup|ReplyKeyboardRemove
+    document_link: str
+    is_document: bool
+
 class RegistrationAdapterClass(AbstractSheetAdapter):
     def __init__(self) -> None:
         super().__init__('registration', 'registration', initialize_as_df=True)
+        self.columns   = ['state', 'question', 'is_main_question', 'reply_keyboard', 'document_link']
+        self.skip_rows = 1
+        self.version = 0
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.registration
+    
+    async def _pre_async_init(self):
         self.update_sleep_time = Settings.registration_update_time
         self.retry_sleep_time  = self.update_sleep_time // 2
     
-    async def _get_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(await self.wks.get_all_records())
-        df = df.drop(index = 0, axis = 0)
+    def _build_df(self, values: list[list[str]]) -> pd.DataFrame:
+        df = self._df_from_values(values)
         df = df.loc[
             (df.state != "") &
             (df.question != "") &
@@ -27,40 +41,47 @@ class RegistrationAdapterClass(AbstractSheetAdapter):
         return df
     
     async def _process_df_update(self):
-        main_selector = self.as_df.is_main_question == True
-        self.first = self._get(main_selector)
+        states = self.as_df.state.to_list()
+        self.table = {
+            row.state: RegistrationState(
+                state          = row.state,
+                question       = row.question,
+                is_main        = row.is_main_question,
+                next_state     = states[idx+1] if idx+1 < len(states) else None,
+                reply_keyboard = self._build_keyboard(row.reply_keyboard),
+                document_link  = row.document_link,
+                is_document    = row.document_link not in ["", None],
+            )
+            for idx,row in enumerate(self.as_df.itertuples(index=False))
+        }
         
-        self.states = self.as_df.state.values
-        self.main_states = self.as_df.loc[main_selector].state.values
+        self.states = tuple(self.table.keys())
+        self.main_states = tuple(state for state,registration in self.table.items() if registration.is_main)
+        self.first = self.table[self.main_states[0]] if len(self.main_states) > 0 else None
 
         self.last_state = self.states[-1]
         self.last_main_state = self.main_states[-1]
+        self.version += 1
 
-        self.is_document_state = lambda state: self.get(state).document_link not in ["", None]
-
-    def _get(self, selector, iloc=0) -> pd.Series:
-        curr = super()._get(selector, iloc)
-        if type(curr) != pd.Series and curr == None:
-            return None
-        if curr.reply_keyboard == '':
-            curr.reply_keyboard = ReplyKeyboardRemove()
-        else:
-            reply_text = curr.reply_keyboard.split("\n")
-            curr.reply_keyboard = ReplyKeyboardMarkup([
-                reply_text[idx:idx+2]
-                for idx in range(0,len(reply_text),2)
-            ])
-        return curr
+    def _build_keyboard(self, reply_keyboard: str) -> ReplyKeyboardMarkup|ReplyKeyboardRemove:
+        if reply_keyboard == '':
+            return ReplyKeyboardRemove()
+        reply_text = reply_keyboard.split("\n")
+        return ReplyKeyboardMarkup([
+            reply_text[idx:idx+2]
+            for idx in range(0,len(reply_text),2)
+        ])
+    
+    def get(self, state: str) -> RegistrationState:
+        return self.table.get(state)
     
-    def get(self, state: str) -> pd.Series:
-        return self._get(self.as_df.state == state)
+    def get_next(self, prev_state: str) -> RegistrationState:
+        return self.table.get(self.table[prev_state].next_state)
     
-    def get_next(self, prev_state: str) -> pd.Series:
-        prev_selector = (self.as_df.state == prev_state)
-        next_index = self.as_df.loc[prev_selector].index[0] + 1
-        return self._get(self.as_df.index == next_index)
+    def is_document_state(self, state: str) -> bool:
+        return self.table[state].is_document
     
     def __contains__(self, state: str):
-        return state in self.states
+        return state in self.table
 
 Registration = RegistrationAdapterClass()
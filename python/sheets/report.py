@@ -1,4 +1,5 @@
 import pandas as pd
+from typing import Callable
 from sheets.sheet import AbstractSheetAdapter
 
 from sheets.i18n import I18n
@@ -7,15 +8,19 @@ from sheets.settings import Settings
 class ReportAdapterClass(AbstractSheetAdapter):
     def __init__(self) -> None:
         super().__init__('report', 'report', initialize_as_df=True)
+        self.columns   = ['title', 'value']
+        self.skip_rows = 1
+        self.sources = []
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.report
+    
+    async def _pre_async_init(self):
         self.update_sleep_time = Settings.report_update_time
         self.retry_sleep_time  = self.update_sleep_time // 2
     
-    async def _get_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(await self.wks.get_all_records())
-        df = df.drop(index = 0, axis = 0)
+    def _build_df(self, values: list[list[str]]) -> pd.DataFrame:
+        df = self._df_from_values(values)
         df = df.loc[
             (df.title != "") &
             (df.value != "")
@@ -30,5 +35,13 @@ class ReportAdapterClass(AbstractSheetAdapter):
 
         self.send_every_x_active_users = Settings.report_send_every_x_active_users
         self.currently_active_users_template = Settings.report_currently_active_users_template
+    
+    def add_source(self, source: Callable[[], list[str]]):
+        self.sources.append(source)
+    
+    def get_markdown(self) -> str:
+        return "\n".join([self.markdown] * (self.markdown != '') + [
+            line for source in self.sources for line in source()
+        ])
 
 Report = ReportAdapterClass()
@@ -1,4 +1,3 @@
-import pandas as pd
 from sheets.sheet import AbstractSheetAdapter
 
 from telegram import Update
@@ -9,18 +8,25 @@ from settings import SettingsUpdateTime
 from sheets.i18n import I18n
 
 class SettingsAdapterClass(AbstractSheetAdapter):
+    DEFAULTS = {
+        'report_active':  'Активные пользователи',
+        'report_banned':  'Заблокировали бота',
+        'report_state':   'На шаге регистрации',
+        'report_answers': 'Ответы',
+    }
+
     def __init__(self) -> None:
         super().__init__('settings', 'settings', SettingsUpdateTime, None, True)
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.settings
     
-    async def _get_df(self) -> pd.DataFrame:
-        return pd.DataFrame(await self.wks.get_all_records())
-    
     async def _process_df_update(self):
         for _,row in self.as_df.iterrows():
             setattr(self, row.key, row.value)
+        for key,value in self.DEFAULTS.items():
+            if not hasattr(self, key):
+                setattr(self, key, value)
         
     def user_template_from_update(self, update: Update) -> str:
         for entity in update.message.entities:
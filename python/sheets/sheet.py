@@ -1,6 +1,5 @@
 from telegram.ext import Application
 import asyncio
-import gspread_asyncio
 from gspread import utils
 import pandas as pd
 
@@ -11,61 +10,144 @@ from telegram import (
 )
 from telegram.ext.filters import MessageFilter
 
-from google.oauth2.service_account import Credentials 
-
-from settings import SheetsSecret, SheetsLink
+from settings import WriteBehindFlushTime, WriteBehindMaxCells
 from drive import SaveToDrive
+from broadcast import Broadcast, BroadcastReport, BroadcastCheckpoint
+from snapshot import SaveSnapshot, LoadSnapshot
+from errors import SheetNotRevalidated
+
+from sheets.connection import Connection, Limiter
+from sheets.lock import SheetLock
 
 from log import Log
 
-def get_creds():
-    creds = Credentials.from_service_account_info(SheetsSecret)
-    scoped = creds.with_scopes([
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ])
-    return scoped
+class AbstractSheetAdapter():
+    TAIL_MERGE_SIZE    = 1000
+    DELTA_MAX_CHANGED  = 0.1
+    REVALIDATE_TIMEOUT = 60
 
-agcm = gspread_asyncio.AsyncioGspreadClientManager(get_creds)
+    adapters = []
 
-class AbstractSheetAdapter():
-    def __init__(self, sheet_name: str, name: str, update_sleep_time: int = None, retry_sleep_time: int = None, initialize_as_df: bool = False) -> None:
+    def __init__(self, sheet_name: str, name: str, update_sleep_time: int = None, retry_sleep_time: int = None, initialize_as_df: bool = False, write_behind: bool = False, delta_refresh: bool = False, compact: bool = False) -> None:
         self.sheet_name = sheet_name
         self.name = name
         self.update_sleep_time = update_sleep_time if update_sleep_time is not None else 3600
         self.retry_sleep_time = retry_sleep_time if retry_sleep_time is not None else update_sleep_time
         self.initialize_as_df = initialize_as_df
+        self.as_df = None
+        self.prefetched_values = None
+        self.bootstrap_range = lambda: utils.absolute_range_name(self.sheet_name)
 
         self.wks_row_pad = 1
         self.wks_col_pad = 1
         self.uid_col     = 'uid'
+
+        self.columns    = None
+        self.skip_rows  = 0
+        self.numericise = True
         
-        self.wks_row  = lambda uid: self.as_df.loc[self.selector(uid)].index.values[0] + self.wks_row_pad
-        self.wks_col  = lambda key: self.as_df.columns.get_loc(key) + self.wks_col_pad
-        self.selector = lambda uid: (self.as_df[self.uid_col] == str(uid))
-        self.exists   = lambda uid: not self.as_df.loc[self.selector(uid)].empty
+        self.uid_index  = {}
+        self.uid_values = lambda df: df[self.uid_col] if self.uid_col in df.columns else []
+
+        self.wks_row  = lambda uid: self.uid_index[str(uid)] + self.wks_row_pad
+        self.wks_col  = lambda key: self._as_df.columns.get_loc(key) + self.wks_col_pad
+        self.exists   = lambda uid: str(uid) in self.uid_index
+
+        self.lock = SheetLock(name)
+        self.revalidated = asyncio.Event()
+        self.revalidated.set()
+
+        self.write_behind = write_behind
+        self.write_behind_flush_time = WriteBehindFlushTime / 1000
+        self.write_behind_max_cells  = WriteBehindMaxCells
+        self.pending_cells = {}
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
+
+        self.delta_refresh = delta_refresh
+        self.row_hashes = []
+        self.last_refresh_changed_rows = 0
+
+        self.fingerprint = None
+        self.refresh_applied = 0
+        self.refresh_skipped = 0
+
+        self.snapshot_attrs = []
+
+        self.compact = compact
+        self.category_columns = []
+        self.integer_columns  = []
 
-        self.mutex = []
-        self.whole_mutex = False
+        AbstractSheetAdapter.adapters.append(self)
     
-    async def async_init(self):
+    @property
+    def as_df(self) -> pd.DataFrame:
+        if len(self.tail) > 0:
+            self._merge_tail()
+        return self._as_df
+    
+    @as_df.setter
+    def as_df(self, df: pd.DataFrame):
+        self._as_df = df
+        self.tail = {}
+    
+    async def async_init(self, values: list[list[str]] = None):
+        self._resolve_sheet_name()
         await self._pre_async_init()
-        await self._connect()
-        if self.initialize_as_df:
-            self.as_df = await self._get_df()
-            Log.info(f"Initialized {self.name} as df")
-            Log.debug(f"\n\n{self.as_df}\n\n")
-        else:
-            self.as_df = None
-            Log.info(f"Initialized {self.name} as sheet")
+        async with self.lock.exclusive():
+            self.prefetched_values = values
+            await self.flush()
+            await self._connect()
+            if self.initialize_as_df:
+                await self._load_df()
+                Log.info(f"Initialized {self.name} as df")
+                Log.debug(f"\n\n{self.as_df}\n\n")
+            else:
+                self.as_df = None
+                Log.info(f"Initialized {self.name} as sheet")
+            self.revalidated.set()
+        await self._post_async_init()
+        self.prefetched_values = None
+        await self._save_snapshot()
+    
+    async def restore_snapshot(self) -> bool:
+        self._resolve_sheet_name()
+        snapshot = LoadSnapshot(self.name)
+        if snapshot is None:
+            Log.info(f"No snapshot for {self.name}")
+            return False
+        await self._pre_async_init()
+        self.revalidated.clear()
+        self.as_df = snapshot['as_df']
+        for key, value in snapshot['attrs'].items():
+            setattr(self, key, value)
+        self.row_hashes = []
+        self.fingerprint = None
+        self._compact_dtypes()
+        self._rebuild_uid_index()
+        await self._post_restore()
+        Log.info(f"Restored {self.name} from snapshot")
+        return True
+    
+    async def _post_restore(self):
         await self._post_async_init()
     
+    async def _save_snapshot(self):
+        payload = {
+            'as_df': self.as_df.copy() if self.as_df is not None else None,
+            'attrs': {key: getattr(self, key) for key in self.snapshot_attrs},
+        }
+        try:
+            await asyncio.to_thread(SaveSnapshot, self.name, payload)
+        except Exception:
+            Log.error(f"Was not able to save snapshot of {self.name}", exc_info=True)
+    
     async def _connect(self):
-        self.agc = await agcm.authorize()
-        self.sh = await self.agc.open_by_url(SheetsLink)
-        self.wks = await self.sh.worksheet(self.sheet_name)
-        Log.debug(f"(Re) Connected to {self.name} sheet")
+        self.wks = await Connection.worksheet(self.sheet_name)
+        Log.debug(f"Connected to {self.name} sheet")
+    
+    def _resolve_sheet_name(self):
+        pass
     
     async def _pre_async_init(self):
         pass
@@ -73,27 +155,198 @@ class AbstractSheetAdapter():
     async def _post_async_init(self):
         await self._process_df_update()
 
-    async def _get_df(self) -> pd.DataFrame:
-        pass
+    def _build_df(self, values: list[list[str]]) -> pd.DataFrame:
+        return self._df_from_values(values)
     
-    async def update(self, app: Application) -> None:
+    def _parse_values(self, values: list[list[str]]) -> tuple[pd.DataFrame, dict]:
+        df = self._compact_df(self._build_df(values))
+        return df, self._build_uid_index(df)
+    
+    def _hash_values(self, values: list[list[str]]) -> list[int]:
+        return [hash(tuple(row)) for row in values]
+    
+    async def _get_values(self) -> list[list[str]]:
+        if self.prefetched_values is not None:
+            values = self.prefetched_values
+            self.prefetched_values = None
+            return values
+        return await Limiter.read(Limiter.BACKGROUND, self.wks.get_all_values)
+    
+    def _df_from_values(self, values: list[list[str]]) -> pd.DataFrame:
+        if len(values) == 0:
+            return pd.DataFrame(columns=self.columns)
+        header = values[0]
+        rows   = values[1 + self.skip_rows:]
+        if any(len(row) != len(header) for row in rows):
+            rows = [row[:len(header)] + [''] * (len(header) - len(row)) for row in rows]
+        
+        names = self.columns if self.columns is not None else header
+        positions = [header.index(name) for name in names] if self.columns is not None else range(len(header))
+        data = [[row[pos] for row in rows] for pos in positions]
+        
+        df = pd.DataFrame({
+            idx: utils.numericise_all(column) if self.numericise else column
+            for idx,column in enumerate(data)
+        }, index=pd.RangeIndex(self.skip_rows, self.skip_rows + len(rows)), columns=range(len(names)))
+        df.columns = names
+        return df
+    
+    async def _load_df(self) -> bool:
+        values = await self._get_values()
+        hashes = await asyncio.to_thread(self._hash_values, values)
+        fingerprint = hash(tuple(hashes))
+        if self.as_df is not None and fingerprint == self.fingerprint:
+            self.refresh_skipped += 1
+            self.last_refresh_changed_rows = 0
+            return False
+        self.fingerprint = fingerprint
+        self.refresh_applied += 1
+        
+        if self.delta_refresh:
+            await self._apply_values_delta(values, hashes[1:])
+            return True
+        self.as_df, self.uid_index = await asyncio.to_thread(self._parse_values, values)
+        self.last_refresh_changed_rows = self.as_df.shape[0]
+        Log.debug(f"Rebuilt {self.uid_col} index of {self.name} with {len(self.uid_index)} keys")
+        return True
+    
+    async def _apply_values_delta(self, values: list[list[str]], hashes: list[int]):
+        self.as_df, self.uid_index, self.last_refresh_changed_rows = await asyncio.to_thread(
+            self._delta_frame, self.as_df, self.row_hashes, values, hashes
+        )
+        self.row_hashes = hashes
+        Log.debug(f"Rebuilt {self.uid_col} index of {self.name} with {len(self.uid_index)} keys")
+    
+    def _delta_frame(self, df: pd.DataFrame, row_hashes: list[int], values: list[list[str]], hashes: list[int]) -> tuple[pd.DataFrame, dict, int]:
+        header = values[0] if len(values) > 0 else []
+        rows   = values[1:]
+        
+        if df is None or list(df.columns) != header or df.shape[0] != len(rows) or len(row_hashes) != len(rows):
+            return *self._parse_values(values), len(rows)
+        changed = [pos for pos, (old, new) in enumerate(zip(row_hashes, hashes)) if old != new]
+        if len(changed) > len(rows) * self.DELTA_MAX_CHANGED:
+            return *self._parse_values(values), len(rows)
+        
+        df = self._expand_df(df)
+        if len(changed) > 0:
+            df.iloc[changed] = [rows[pos] for pos in changed]
+        df = self._compact_df(df)
+        return df, self._build_uid_index(df), len(changed)
+    
+    def _compact_dtypes(self):
+        if self._as_df is not None:
+            self._as_df = self._compact_df(self._as_df)
+    
+    def _compact_df(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.compact or df.empty:
+            return df
+        for column in self.category_columns:
+            if column not in df.columns or isinstance(df[column].dtype, pd.CategoricalDtype):
+                continue
+            if df[column].nunique() * 2 <= df.shape[0]:
+                df[column] = df[column].astype('category')
+        for column in self.integer_columns:
+            if column not in df.columns or pd.api.types.is_integer_dtype(df[column]):
+                continue
+            if df[column].astype(str).str.fullmatch(r'-?\d+').all():
+                df[column] = df[column].astype('int64')
+        return df
+    
+    def _expand_df(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.compact or df.empty:
+            return df.copy()
+        return df.astype({
+            column: object for column in df.columns
+            if isinstance(df[column].dtype, pd.CategoricalDtype) or column in self.integer_columns
+        })
+    
+    def _next_label(self) -> int:
+        if len(self.tail) > 0:
+            return next(reversed(self.tail)) + 1
+        if self._as_df is None or self._as_df.empty:
+            return 0
+        return self._as_df.index[-1] + 1
+    
+    def _append_record(self, record: dict) -> int:
+        row = {column: record.get(column) if record.get(column) is not None else '' for column in self._as_df.columns}
+        if self.compact:
+            idx = self._next_label()
+            self.tail[idx] = row
+            if len(self.tail) >= self.TAIL_MERGE_SIZE:
+                self._merge_tail()
+            return idx
+        tmp_df = pd.DataFrame(row, columns=self._as_df.columns, index=[0])
+        if self._as_df.empty:
+            self.as_df = tmp_df
+        else:
+            self.as_df = pd.concat([self._as_df, tmp_df], ignore_index=True)
+        return self._as_df.index[-1]
+    
+    def _merge_tail(self):
+        tail, self.tail = self.tail, {}
+        tail_df = pd.DataFrame(list(tail.values()), index=list(tail.keys()), columns=self._as_df.columns)
+        if self._as_df.empty:
+            self._as_df = self._compact_df(tail_df)
+        else:
+            self._as_df = pd.concat([self._as_df, self._match_dtypes(tail_df)])
+        Log.debug(f"Merged {len(tail)} appended rows into {self.name}")
+    
+    def _match_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+        for column in df.columns:
+            dtype = self._as_df[column].dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                missing = [value for value in df[column].unique() if value not in dtype.categories]
+                if len(missing) > 0:
+                    self._as_df[column] = self._as_df[column].cat.add_categories(missing)
+                df[column] = pd.Categorical(df[column], categories=self._as_df[column].cat.categories)
+            elif pd.api.types.is_integer_dtype(dtype):
+                if df[column].astype(str).str.fullmatch(r'-?\d+').all():
+                    df[column] = df[column].astype('int64')
+                else:
+                    self._as_df[column] = self._as_df[column].astype(object)
+        return df
+    
+    def memory_usage(self) -> int:
+        if self._as_df is None:
+            return 0
+        return int(self._as_df.memory_usage(deep=True).sum())
+    
+    async def update(self) -> None:
         await self._pre_update()
-        await asyncio.sleep(self.update_sleep_time)
         
         Log.info(f"Prepared to update whole df {self.name}")
-        while len(self.mutex) > 0:
-            Log.info(f"Halted whole df update at {self.name} with mutex {self.mutex}")
-            await asyncio.sleep(self.retry_sleep_time)
-        app.create_task(self.update(app))
-        self.whole_mutex = True
+        async with self.lock.exclusive():
+            await self.flush()
+            if len(self.pending_cells) > 0:
+                Log.info(f"Postponed update of whole df {self.name} until {len(self.pending_cells)} pending cells are written")
+                return
+            await self._connect()
+            try:
+                changed = await self._load_df()
+            except Exception:
+                Connection.invalidate(self.sheet_name)
+                raise
+            self.revalidated.set()
         
-        await self._connect()
-        self.as_df = await self._get_df()
-        self.whole_mutex = False
+        if not changed:
+            Log.info(f"Skipped update of whole df {self.name} with unchanged data, {self.refresh_skipped} skipped and {self.refresh_applied} applied so far")
+            return
 
-        Log.info(f"Updated whole df {self.name}")
+        Log.info(f"Updated whole df {self.name} with {self.last_refresh_changed_rows} changed rows, {self.refresh_skipped} skipped and {self.refresh_applied} applied so far")
+        Log.debug(f"Current lock metrics at {self.name} are {self.lock.metrics()}")
         Log.debug(f"\n\n{self.as_df}\n\n")
         await self._post_update()
+        await self._save_snapshot()
+    
+    def _rebuild_uid_index(self):
+        self.uid_index = self._build_uid_index(self.as_df) if self.as_df is not None else {}
+        Log.debug(f"Rebuilt {self.uid_col} index of {self.name} with {len(self.uid_index)} keys")
+    
+    def _build_uid_index(self, df: pd.DataFrame) -> dict:
+        if df.empty:
+            return {}
+        uids = [str(uid) for uid in self.uid_values(df)]
+        return dict(zip(reversed(uids), reversed(df.index.to_list())))
     
     async def _pre_update(self):
         pass
@@ -104,106 +357,236 @@ class AbstractSheetAdapter():
     async def _process_df_update(self):
         pass
     
-    async def _next_available_row(self) -> str:
-        str_list = list(filter(None, await self.wks.col_values(1)))
-        return str(len(str_list)+1)
-    
-    async def _find_col_by_data(self, data) -> int:
-        cell = await self.wks.find(data)
-        return cell.col
-    
     def _prepare_batch_update(self, rowcols: list[tuple[str|int]]) -> list[str]:
         return [{
             'range': utils.rowcol_to_a1(x[0], x[1]),
             'values': [[x[2]]],
         } for x in rowcols ]
     
-    async def _update_record(self, uid: str|int, key: str, value: str):
-        selector = self.selector(uid)
-        if self.as_df.loc[selector].empty:
+    def _prepare_ranges_update(self, cells: dict[tuple[int,int],str]) -> list[dict]:
+        ranges = []
+        for row, col in sorted(cells.keys()):
+            if len(ranges) > 0 and ranges[-1][0] == row and ranges[-1][2] == col - 1:
+                ranges[-1][2] = col
+                ranges[-1][3].append(cells[(row, col)])
+            else:
+                ranges.append([row, col, col, [cells[(row, col)]]])
+        return [{
+            'range': f"{utils.rowcol_to_a1(row, first_col)}:{utils.rowcol_to_a1(row, last_col)}",
+            'values': [values],
+        } for row, first_col, last_col, values in ranges ]
+    
+    def _queue_cells(self, rowcols: list[tuple[str|int]]):
+        for row, col, value in rowcols:
+            self.pending_cells[(int(row), int(col))] = value
+        if len(self.pending_cells) >= self.write_behind_max_cells and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.create_task(self.flush())
+    
+    async def flush(self):
+        async with self.flush_lock:
+            if len(self.pending_cells) == 0:
+                return
+            cells = self.pending_cells
+            self.pending_cells = {}
+            wks_update = self._prepare_ranges_update(cells)
+            
+            Log.info(f"Prepared to flush {len(cells)} cells in {len(wks_update)} ranges to {self.name}")
+            try:
+                await self._connect()
+                await Limiter.write(Limiter.INTERACTIVE, self.wks.batch_update, wks_update)
+            except Exception:
+                for rowcol, value in cells.items():
+                    self.pending_cells.setdefault(rowcol, value)
+                Connection.invalidate(self.sheet_name)
+                Log.error(f"Error while flushing {len(cells)} cells to {self.name}, kept them pending", exc_info=True)
+                return
+            Log.info(f"Done flush {len(cells)} cells to {self.name}")
+    
+    
+    def _get_value(self, idx: int, key: str) -> str:
+        if idx in self.tail:
+            return self.tail[idx][key]
+        return self._as_df.at[idx, key]
+    
+    def _set_value(self, idx: int, key: str, value: str):
+        if key not in self._as_df.columns and len(self.tail) > 0:
+            self._merge_tail()
+        if idx in self.tail:
+            old = self.tail[idx][key]
+            self.tail[idx][key] = value
+            self._record_updated(idx, key, old, value)
             return
-        self.as_df.loc[selector, key] = value
-        wks_row = self.wks_row(uid)
-        wks_col = self.wks_col(key)
-        
+        df = self._as_df
+        old = df.at[idx, key] if key in df.columns else None
+        if key in df.columns and isinstance(df[key].dtype, pd.CategoricalDtype) and value not in df[key].cat.categories:
+            df[key] = df[key].cat.add_categories([value])
+        df.loc[idx, key] = value
+        self._record_updated(idx, key, old, value)
+    
+    def _record_updated(self, idx: int, key: str, old: str|None, value: str):
+        pass
+    
+    def _get_row_values(self, idx: int, keys: list[str]) -> dict:
+        return {key: self._get_value(idx, key) for key in keys if key in self._as_df.columns}
+    
+    def _restore_values(self, idx: int, values: dict):
+        for key, value in values.items():
+            self._set_value(idx, key, value)
+        Log.info(f"Restored {list(values.keys())} of row {idx} in {self.name} after failed write")
+    
+    def _mark_dirty(self, idx: int):
+        self.fingerprint = None
+        if idx in self._as_df.index:
+            pos = self._as_df.index.get_loc(idx)
+            if pos < len(self.row_hashes):
+                self.row_hashes[pos] = None
+    
+    async def _wait_revalidated(self):
+        if self.revalidated.is_set():
+            return
+        Log.info(f"Holding write to {self.name} until restored snapshot is revalidated")
+        try:
+            await asyncio.wait_for(self.revalidated.wait(), self.REVALIDATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            Log.error(f"Restored snapshot of {self.name} was not revalidated in {self.REVALIDATE_TIMEOUT}s, rejected write")
+            raise SheetNotRevalidated(self.name)
+    
+    async def _update_record(self, uid: str|int, key: str, value: str):
         Log.info(f"Prepeared to update single record in {self.name} with {self.uid_col} {uid} write to {key} collumn")
-        while self.whole_mutex:
-            Log.info(f"Halted single update record in {self.name} with {self.uid_col} {uid} write to {key} collumn with whole mutex")
-            await asyncio.sleep(self.retry_sleep_time)
-        
-        self.mutex.append(uid)
-        await self.wks.update_cell(wks_row, wks_col, value)
-        del self.mutex[self.mutex.index(uid)]
+        await self._wait_revalidated()
+        async with self.lock.shared(uid):
+            idx = self.uid_index.get(str(uid))
+            if idx is None:
+                return
+            olds = self._get_row_values(idx, [key])
+            self._set_value(idx, key, value)
+            wks_row = idx + self.wks_row_pad
+            wks_col = self.wks_col(key)
+            
+            if self.write_behind:
+                self._queue_cells([(wks_row, wks_col, value)])
+                Log.info(f"Queued single record in {self.name} with {self.uid_col} {uid} write to {key} collumn")
+                return
+            
+            try:
+                await self._connect()
+                await Limiter.write(Limiter.INTERACTIVE, self.wks.update_cell, wks_row, wks_col, value)
+            except Exception:
+                self._restore_values(idx, olds)
+                self._mark_dirty(idx)
+                raise
         
         Log.info(f"Done update single record in {self.name} with {self.uid_col} {uid} write to {key} collumn")
-        Log.debug(f"Current mutext at {self.name} is {self.mutex}")
+    
+    async def _update_records(self, uids: list[str|int], key: str, value: str):
+        Log.info(f"Prepeared to update {len(uids)} records in {self.name} write to {key} collumn")
+        await self._wait_revalidated()
+        async with self.lock.shared():
+            wks_col = self.wks_col(key)
+            cells = {}
+            olds  = {}
+            for uid in uids:
+                idx = self.uid_index.get(str(uid))
+                if idx is None:
+                    continue
+                olds.setdefault(idx, self._get_row_values(idx, [key]))
+                self._set_value(idx, key, value)
+                cells[(int(idx + self.wks_row_pad), wks_col)] = value
+            if len(cells) == 0:
+                return
+            
+            if self.write_behind:
+                self._queue_cells([(row, col, value) for (row, col), value in cells.items()])
+                Log.info(f"Queued {len(cells)} records in {self.name} write to {key} collumn")
+                return
+            
+            try:
+                await self._connect()
+                await Limiter.write(Limiter.BACKGROUND, self.wks.batch_update, self._prepare_ranges_update(cells))
+            except Exception:
+                for idx, old in olds.items():
+                    self._restore_values(idx, old)
+                    self._mark_dirty(idx)
+                raise
+        
+        Log.info(f"Done update {len(cells)} records in {self.name} write to {key} collumn")
     
     async def _batch_update_or_create_record(self, uid: str|int, save_to = None, save_as = None, app: Application = None, **record_params):
-        exists = self.exists(uid)
-        record_action = 'update' if exists else 'create'
         collumns = record_params.keys()
         
-        Log.info(f"Prepeared to batch update {record_action} record in {self.name} with {self.uid_col} {uid} and {collumns} collumns")
-        while self.whole_mutex:
-            Log.info(f"Halted to batch update {record_action} record in {self.name} with {self.uid_col} {uid} and {collumns} collumns with whole mutex")
-            await asyncio.sleep(self.retry_sleep_time)
-        self.mutex.append(uid)
-
-        get_file = None
-        for key,val in record_params.items():
-            if type(val) in [list, tuple]:
-                record_params[key] = val[-1].to_json()
-                get_file = val[-1].get_file
-            if type(val) == Document:
-                record_params[key] = val.to_json()
-                get_file = val.get_file
-        
-        if not exists:
-            record_params[self.uid_col] = str(uid)
-            tmp_df = pd.DataFrame(record_params, columns=self.as_df.columns, index=[0]).fillna('')
-            if self.as_df.empty:
-                self.as_df = tmp_df
+        Log.info(f"Prepeared to batch update or create record in {self.name} with {self.uid_col} {uid} and {collumns} collumns")
+        await self._wait_revalidated()
+        async with self.lock.shared(uid):
+            exists = self.exists(uid)
+            record_action = 'update' if exists else 'create'
+
+            get_file = None
+            for key,val in record_params.items():
+                if type(val) in [list, tuple]:
+                    record_params[key] = val[-1].to_json()
+                    get_file = val[-1].get_file
+                if type(val) == Document:
+                    record_params[key] = val.to_json()
+                    get_file = val.get_file
+            
+            if not exists:
+                record_params[self.uid_col] = str(uid)
+                idx = self._append_record(record_params)
+                self.uid_index[str(uid)] = idx
+                for key in self._as_df.columns:
+                    self._record_updated(idx, key, None, self._get_value(idx, key))
             else:
-                self.as_df = pd.concat([self.as_df, tmp_df], ignore_index=True)
-        else:
-            for key, value in record_params.items():
-                self.as_df.loc[self.selector(uid), key] = value
-
-        wks_row = self.wks_row(uid)
-        wks_update = self._prepare_batch_update([
-            (wks_row, self.wks_col(key), value)
-            for key, value in record_params.items()
-        ])
-        
-        await self.wks.batch_update(wks_update)
-        if get_file != None and save_to != None and save_as != None and app != None:
-            app.create_task(SaveToDrive(self.agc.gc.auth.token, save_to, save_as, get_file))
+                idx = self.uid_index[str(uid)]
+                olds = self._get_row_values(idx, record_params.keys())
+                for key, value in record_params.items():
+                    self._set_value(idx, key, value)
+
+            wks_row = self.wks_row(uid)
+            rowcols = [
+                (wks_row, self.wks_col(key), value)
+                for key, value in record_params.items()
+            ]
+            
+            if self.write_behind:
+                self._queue_cells(rowcols)
+            else:
+                try:
+                    await self._connect()
+                    await Limiter.write(Limiter.INTERACTIVE, self.wks.batch_update, self._prepare_batch_update(rowcols))
+                except Exception:
+                    if exists:
+                        self._restore_values(idx, olds)
+                    self._mark_dirty(idx)
+                    raise
+            if get_file != None and save_to != None and save_as != None and app != None:
+                app.create_task(SaveToDrive(Connection.token(), save_to, save_as, get_file))
         
-        del self.mutex[self.mutex.index(uid)]
         Log.info(f"Done batch update {record_action} record in {self.name} with {self.uid_col} {uid} and {collumns} collumns")
-        Log.debug(f"Current mutext at {self.name} is {self.mutex}")
     
     def _get(self, selector, iloc = 0) -> pd.Series:
         row = self.as_df.loc[selector]
         if row.empty:
             return None
         return row.iloc[iloc]
+    
+    def _get_by_uid(self, uid: str|int) -> pd.Series:
+        idx = self.uid_index.get(str(uid))
+        if idx is None:
+            return None
+        if idx in self.tail:
+            return pd.Series(self.tail[idx], name=idx)
+        return self._as_df.loc[idx]
 
+    def _get_uids(self, selector) -> list[str]:
+        return self.as_df.loc[selector][self.uid_col].to_list()
+    
     async def _send_to_all_uids(self, selector, bot: Bot, message: str, parse_mode: str, 
-        send_photo: str = None, reply_markup: InlineKeyboardMarkup = None
-    ):
-        if send_photo == None or send_photo == '':
-            for uid in self.as_df.loc[selector][self.uid_col].to_list():
-                try:
-                    await bot.send_message(chat_id=uid, text=message, parse_mode=parse_mode, reply_markup=reply_markup)
-                except Exception:
-                    Log.info(f"Error while sending message to id {uid}")
-            return
-        for uid in self.as_df.loc[selector][self.uid_col].to_list():
-            try:
-                await bot.send_photo(chat_id=uid, photo=send_photo, caption=message, parse_mode=parse_mode, reply_markup=reply_markup)
-            except Exception:
-                Log.info(f"Error while sending photo to id {uid}")
+        send_photo: str = None, reply_markup: InlineKeyboardMarkup = None,
+        checkpoint: BroadcastCheckpoint = None, stage: str = None
+    ) -> BroadcastReport:
+        uids = self._get_uids(selector)
+        Log.info(f"Prepared to send message to {len(uids)} ids in {self.name}")
+        return await Broadcast.send(bot, uids, message, parse_mode, send_photo, reply_markup, checkpoint, stage)
     
     class AbstractFilter(MessageFilter):
         def __init__(self, name: str = None, data_filter: bool = False, outer_obj = None):
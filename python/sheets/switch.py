@@ -10,13 +10,14 @@ from errors import BotShouldBeInactive
 class SwitchAdapterClass(AbstractSheetAdapter):
     def __init__(self) -> None:
         super().__init__('switch', 'switch', SwitchUpdateTime, None, True)
+        self.columns   = ['bot_active', 'user_registration_open']
+        self.skip_rows = 1
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.switch
     
-    async def _get_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(await self.wks.get_all_records())
-        df = df.drop(index = 0, axis = 0)
+    def _build_df(self, values: list[list[str]]) -> pd.DataFrame:
+        df = self._df_from_values(values)
         df = df.loc[
             (df.bot_active.isin(I18n.yes_no)) &
             (df.user_registration_open.isin(I18n.yes_no))
@@ -1,3 +1,4 @@
+import asyncio
 import pandas as pd
 from sheets.sheet import AbstractSheetAdapter
 
@@ -26,11 +27,24 @@ from sheets.groups import Groups
 from sheets.report import Report
 from sheets.keyboard import Keyboard
 from sheets.notifications import Notifications
+from settings import WriteBehind, CompactStorage
+from broadcast import BroadcastReport
+from media import Media
 from log import Log
 
 from datetime import datetime
+from enum import Enum
+from collections import Counter
 import re
 
+class UserState(Enum):
+    NOT_REGISTERED     = 'not_registered'
+    REGISTERING        = 'registering'
+    IDLE               = 'idle'
+    CHANGING           = 'changing'
+    NOTIFICATION_REPLY = 'notification_reply'
+    UNKNOWN            = 'unknown'
+
 class UsersAdapterClass(AbstractSheetAdapter):
     CALLBACK_USER_SET_INACTIVE         = 'user_set_inactive'
     CALLBACK_USER_SET_ACTIVE           = 'user_set_active'
@@ -43,8 +57,10 @@ class UsersAdapterClass(AbstractSheetAdapter):
     USER_CHANGE_STATE_TEMPLATE   = '{user_change}_{state}@{message_id}'
     USER_CHANGE_STATE_SEPARATORS = '_|@'
 
+    CLASSIFIED_CACHE_SIZE = 1024
+
     def __init__(self) -> None:
-        super().__init__('users', 'users', initialize_as_df=True)
+        super().__init__('users', 'users', initialize_as_df=True, write_behind=WriteBehind, delta_refresh=True, compact=CompactStorage)
         
         self.PrivateChatFilter                = self.PrivateChatClass(outer_obj=self)
         self.IsRegistrationOpenedFilter       = self.IsRegistrationOpenedClass(outer_obj=self)
@@ -69,18 +85,32 @@ class UsersAdapterClass(AbstractSheetAdapter):
         self.wks_row_pad = 2
         self.wks_col_pad = 1
         self.uid_col     = 'chat_id'
+        self.numericise  = False
+        self.category_columns = ['is_active', 'is_bot_banned']
+        self.integer_columns  = ['chat_id']
 
-        self.get   = lambda uid: self._get(self.selector(uid))
+        self.get   = lambda uid: self._get_by_uid(uid)
         self.state = lambda uid: self.get(uid).state
-        self.active_user_count  = lambda: self.as_df.loc[self.as_df.is_active == I18n.yes].shape[0]
+        self.classified = {}
+
+        self.counters = {'active': 0, 'banned': 0}
+        self.state_counts  = Counter()
+        self.answer_counts = {}
+        Report.add_source(self.aggregates_markdown)
+
+        self.row_versions = {}
+        self.render_cache = {}
+        self.user_data_markdown        = lambda user: self._render_user_data(user)[0]
+        self.user_data_inline_keyboard = lambda user: self._render_user_data(user)[1]
+        self.active_user_count  = lambda: self.counters['active']
         self.should_send_report = lambda count: count % Report.send_every_x_active_users == 0
 
         self.is_active = lambda user: user.is_active == I18n.yes
-        self.user_data_markdown = lambda user: "\n".join([
+        self._user_data_markdown = lambda user: "\n".join([
             f"{state}: *{user[state] if not Registration.is_document_state(state) else state}*"
             for state in Registration.main_states
         ]) + f"\n*{I18n.is_active if self.is_active(user) else I18n.is_inactive}*"
-        self.user_data_inline_keyboard = lambda user: InlineKeyboardMarkup([
+        self._user_data_inline_keyboard = lambda user: InlineKeyboardMarkup([
             [
                 InlineKeyboardButton(
                     user[state] if not Registration.is_document_state(state) else state,
@@ -97,26 +127,95 @@ class UsersAdapterClass(AbstractSheetAdapter):
             (self.as_df[column] == I18n.yes) &
             (self.as_df.is_bot_banned == I18n.no)
         )
+        self.selector_notification = lambda condition: self.selector_condition(
+            'is_active' if condition in [None, ''] else condition
+        )
+        self.notification_uids = lambda condition: self._get_uids(self.selector_notification(condition))
     
-    async def _pre_async_init(self):
+    def _resolve_sheet_name(self):
         self.sheet_name = I18n.users
+    
+    async def _pre_async_init(self):
         self.update_sleep_time = Settings.users_update_time
         self.retry_sleep_time  = Settings.retry_time
     
-    async def _get_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(await self.wks.get_all_records())
-        df.chat_id = df.chat_id.apply(str)
-        return df
+    async def _process_df_update(self):
+        async with self.lock.exclusive():
+            self.counters, self.state_counts, self.answer_counts = await asyncio.to_thread(self._build_aggregates, self.as_df)
+            self.row_versions = {}
+            self.render_cache = {}
+    
+    def _build_aggregates(self, df: pd.DataFrame) -> tuple[dict, Counter, dict]:
+        counters = {
+            'active': int((df.is_active == I18n.yes).sum()),
+            'banned': int((df.is_bot_banned == I18n.yes).sum()),
+        }
+        state_counts = Counter(df.state.to_list())
+        answer_counts = {
+            column: Counter(df[column].to_list())
+            for column in Notifications.states if column in df.columns
+        }
+        return counters, state_counts, answer_counts
+    
+    def _record_updated(self, idx: int, key: str, old: str|None, value: str):
+        self.row_versions[idx] = self.row_versions.get(idx, 0) + 1
+        if old is not None:
+            self._count(key, old, -1)
+        self._count(key, value, 1)
+    
+    def _count(self, key: str, value: str, delta: int):
+        if key == 'is_active' and value == I18n.yes:
+            self.counters['active'] += delta
+        elif key == 'is_bot_banned' and value == I18n.yes:
+            self.counters['banned'] += delta
+        elif key == 'state':
+            self.state_counts[value] += delta
+        elif key in self.answer_counts:
+            self.answer_counts[key][value] += delta
+    
+    def _render_user_data(self, user: pd.Series) -> tuple[str, InlineKeyboardMarkup]:
+        version = (self.row_versions.get(user.name, 0), Registration.version)
+        cached = self.render_cache.get(user.name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        rendered = (self._user_data_markdown(user), self._user_data_inline_keyboard(user))
+        self.render_cache[user.name] = (version, rendered)
+        return rendered
+    
+    def aggregates_markdown(self) -> list[str]:
+        answer_counts = dict(self.answer_counts)
+        for column in Notifications.states:
+            if column not in answer_counts and column in self.as_df.columns:
+                answer_counts[column] = Counter(self.as_df[column].to_list())
+        return [
+            f"{Settings.report_active}: `{self.counters['active']}`",
+            f"{Settings.report_banned}: `{self.counters['banned']}`",
+        ] + [
+            f"{Settings.report_state} {state}: `{self.state_counts[state]}`"
+            for state in Registration.states if self.state_counts[state] > 0
+        ] + [
+            f"{Settings.report_answers} {column}: " + ", ".join(
+                f"{answer} `{count}`" for answer,count in counts.most_common() if answer != '' and count > 0
+            )
+            for column,counts in answer_counts.items() if any(answer != '' and count > 0 for answer,count in counts.items())
+        ]
     
     async def banned(self, chat_id: int|str):
         await self._update_record(chat_id, 'is_bot_banned', I18n.yes)
     
+    async def banned_by_broadcast(self, report: BroadcastReport):
+        if len(report.blocked_uids) == 0:
+            return
+        await self._update_records(report.blocked_uids, 'is_bot_banned', I18n.yes)
+        Log.info(f"Marked {len(report.blocked_uids)} users as banned after broadcast")
+        await LogSheet.write(None, f"Marked {len(report.blocked_uids)} users as banned after broadcast")
+    
     async def unbanned(self, chat_id: int|str):
         await self._update_record(chat_id, 'is_bot_banned', I18n.no)
     
     async def _change_message_after_callback(self, chat_id: int|str, message_id: int|str, bot: Bot) -> None:
         try:
-            user = self._get(self.selector(chat_id))
+            user = self.get(chat_id)
             keyboard_row = Keyboard.registration_keyboard_row
             await bot.edit_message_text(
                 keyboard_row.text_markdown.format(user=self.user_data_markdown(user)),
@@ -137,16 +236,31 @@ class UsersAdapterClass(AbstractSheetAdapter):
             return(message.document, document_link)
         return (None, None)
     
-    async def send_notification_to_all_users(self, bot: Bot, message: str, parse_mode: str,
-                                             send_photo: str = None, state: str = None,
-                                             condition: str = None):
-        condition_column = 'is_active' if condition in [None, ''] else condition
-        await self._send_to_all_uids(
-            self.selector_condition(condition_column),
-            bot, message, parse_mode,
-            send_photo,
-            reply_markup=Notifications.get_keyboard(state)
-        )
+    def classify(self, message: Message) -> UserState:
+        key = (message.chat_id, message.message_id, message.edit_date)
+        user_state = self.classified.get(key)
+        if user_state is not None:
+            return user_state
+        
+        idx = self.uid_index.get(str(message.chat_id))
+        state = self._get_value(idx, 'state') if idx is not None else None
+        if idx is None:
+            user_state = UserState.NOT_REGISTERED
+        elif state in Registration:
+            user_state = UserState.REGISTERING
+        elif state == '':
+            user_state = UserState.IDLE
+        elif str(state).startswith(I18n.user_change):
+            user_state = UserState.CHANGING
+        elif state in Notifications.states:
+            user_state = UserState.NOTIFICATION_REPLY
+        else:
+            user_state = UserState.UNKNOWN
+        
+        self.classified[key] = user_state
+        if len(self.classified) > self.CLASSIFIED_CACHE_SIZE:
+            del self.classified[next(iter(self.classified))]
+        return user_state
     
     class PrivateChatClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
@@ -158,39 +272,23 @@ class UsersAdapterClass(AbstractSheetAdapter):
     
     class IsRegisteredClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
-            return self.outer_obj.exists(message.chat_id)
+            return self.outer_obj.classify(message) != UserState.NOT_REGISTERED
 
     class HasActiveRegistrationStateClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
-            df = self.outer_obj.as_df
-            return not df.loc[
-                (self.outer_obj.selector(message.chat_id)) &
-                (df.state.isin(Registration.states))
-            ].empty
+            return self.outer_obj.classify(message) == UserState.REGISTERING
 
     class HasNoRegistrationStateClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
-            df = self.outer_obj.as_df
-            return not df.loc[
-                (self.outer_obj.selector(message.chat_id)) &
-                (df.state == '')
-            ].empty
+            return self.outer_obj.classify(message) == UserState.IDLE
 
     class HasChangeRegistrationStateClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
-            df = self.outer_obj.as_df
-            return not df.loc[
-                (self.outer_obj.selector(message.chat_id)) &
-                (df.state.str.startswith(I18n.user_change))
-            ].empty
+            return self.outer_obj.classify(message) == UserState.CHANGING
 
     class HasNotificationRegistrationStateClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
-            df = self.outer_obj.as_df
-            return not df.loc[
-                (self.outer_obj.selector(message.chat_id)) &
-                (df.state.isin(Notifications.states))
-            ].empty
+            return self.outer_obj.classify(message) == UserState.NOTIFICATION_REPLY
     
     class InputInKeyboardKeysClass(AbstractSheetAdapter.AbstractFilter):
         def filter(self, message: Message) -> bool:
@@ -273,7 +371,7 @@ class UsersAdapterClass(AbstractSheetAdapter):
     async def keyboard_key_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         keyboard_row = Keyboard.get(update.message.text)
         if keyboard_row.function == Keyboard.REGISTER_FUNCTION:
-            user = self._get(self.selector(update.effective_chat.id))
+            user = self.get(update.effective_chat.id)
             await update.message.reply_markdown(
                 keyboard_row.text_markdown.format(user=self.user_data_markdown(user)),
                 reply_markup=self.user_data_inline_keyboard(user)
@@ -284,19 +382,25 @@ class UsersAdapterClass(AbstractSheetAdapter):
                 reply_markup=Keyboard.reply_keyboard
             )
         elif keyboard_row.send_picture != '' and len(keyboard_row.text_markdown) <= 1024:
-            await update.message.reply_photo(
-                keyboard_row.send_picture,
-                caption=keyboard_row.text_markdown,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=Keyboard.reply_keyboard
+            await Media.send_photo(
+                lambda photo: update.message.reply_photo(
+                    photo,
+                    caption=keyboard_row.text_markdown,
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=Keyboard.reply_keyboard
+                ),
+                keyboard_row.send_picture
             )
         elif keyboard_row.send_picture != '' and len(keyboard_row.text_markdown) > 1024:
             await update.message.reply_markdown(
                 keyboard_row.text_markdown
             )
-            await update.message.reply_photo(
-                keyboard_row.send_picture,
-                reply_markup=Keyboard.reply_keyboard
+            await Media.send_photo(
+                lambda photo: update.message.reply_photo(
+                    photo,
+                    reply_markup=Keyboard.reply_keyboard
+                ),
+                keyboard_row.send_picture
             )
     
     async def set_active_state_callback_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
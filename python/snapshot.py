@@ -0,0 +1,34 @@
+import os
+import gzip
+import pickle
+
+from settings import SnapshotDir
+from log import Log
+
+def SnapshotPath(name: str) -> str:
+    return os.path.join(SnapshotDir, f"{name}.pkl.gz")
+
+def SaveSnapshot(name: str, payload) -> None:
+    os.makedirs(SnapshotDir, exist_ok=True)
+    path = SnapshotPath(name)
+    with gzip.open(f"{path}.tmp", 'wb', compresslevel=1) as fp:
+        pickle.dump(payload, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.tmp", path)
+    Log.debug(f"Saved snapshot {path}")
+
+def LoadSnapshot(name: str):
+    path = SnapshotPath(name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, 'rb') as fp:
+            return pickle.load(fp)
+    except Exception:
+        Log.error(f"Was not able to load snapshot {path}", exc_info=True)
+        return None
+
+def RemoveSnapshot(name: str) -> None:
+    path = SnapshotPath(name)
+    if os.path.exists(path):
+        os.remove(path)
+        Log.debug(f"Removed snapshot {path}")
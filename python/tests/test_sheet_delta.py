@@ -0,0 +1,71 @@
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+for key, value in {
+    'BOT_TOKEN': 'test', 'SHEETS_ACC_JSON': '{}', 'SHEETS_LINK': 'test',
+    'SWITCH_UPDATE_TIME': '60', 'SETTINGS_UPDATE_TIME': '60',
+}.items():
+    os.environ.setdefault(key, value)
+
+from sheets.sheet import AbstractSheetAdapter
+
+HEADER = ['chat_id', 'name']
+
+def Values(*uids: str) -> list[list[str]]:
+    return [HEADER] + [[uid, f"name {uid}"] for uid in uids]
+
+class DeltaRefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.adapter = AbstractSheetAdapter('test', 'test', delta_refresh=True)
+        self.adapter.uid_col = 'chat_id'
+        self.adapter.numericise = False
+
+    def load(self, values: list[list[str]]):
+        hashes = self.adapter._hash_values(values)
+        asyncio.run(self.adapter._apply_values_delta(values, hashes[1:]))
+
+    def assertIndexed(self, *uids: str):
+        self.assertEqual(self.adapter.as_df.chat_id.to_list(), list(uids))
+        self.assertEqual(set(self.adapter.uid_index.keys()), set(uids))
+        for uid, idx in self.adapter.uid_index.items():
+            self.assertEqual(self.adapter.as_df.at[idx, 'chat_id'], uid)
+            self.assertEqual(self.adapter.as_df.at[idx, 'name'], f"name {uid}")
+
+    def test_changed_row(self):
+        uids = [str(uid) for uid in range(20)]
+        self.load(Values(*uids))
+        uids[3] = '100'
+        self.load(Values(*uids))
+        self.assertIndexed(*uids)
+        self.assertEqual(self.adapter.last_refresh_changed_rows, 1)
+
+    def test_deleted_row(self):
+        self.load(Values('A', 'B', 'C', 'D'))
+        self.load(Values('A', 'C', 'D'))
+        self.assertIndexed('A', 'C', 'D')
+
+    def test_deleted_first_row(self):
+        uids = [str(uid) for uid in range(1000)]
+        self.load(Values(*uids))
+        self.load(Values(*uids[1:]))
+        self.assertIndexed(*uids[1:])
+
+    def test_inserted_row(self):
+        self.load(Values('A', 'B', 'C'))
+        self.load(Values('A', 'X', 'B', 'C'))
+        self.assertIndexed('A', 'X', 'B', 'C')
+
+    def test_reordered_rows(self):
+        self.load(Values('A', 'B', 'C', 'D'))
+        self.load(Values('D', 'C', 'A', 'B'))
+        self.assertIndexed('D', 'C', 'A', 'B')
+
+    def test_duplicate_uid_keeps_first_row(self):
+        self.load(Values('A', 'B', 'A'))
+        self.assertEqual(self.adapter.uid_index['A'], 0)
+
+if __name__ == '__main__':
+    unittest.main()